@@ -15,18 +15,19 @@ import scipy.signal
 from matplotlib import cm
 import gsw
 from gsw.density import sigma0
+from steric import Mesh, Regions, Comparison, ResultCache, ResultStore, plot_cells
 
-fmesh=netCDF4.Dataset('/project/projectdirs/e3sm/inputdata/ocn/mpas-o/oEC60to30v3wLI/oEC60to30v3wLI60lev.171031.nc') # Cryo
-#fmesh=netCDF4.Dataset('/global/cscratch1/sd/hoffman2/SLR_tests/oEC60to30v3_60layer.restartFrom_anvil0926.171101.nc') # WC v1
-latCell = fmesh.variables['latCell'][:]
-lonCell = fmesh.variables['lonCell'][:]
-xCell = fmesh.variables['xCell'][:]
-yCell = fmesh.variables['yCell'][:]
-depths = fmesh.variables['refBottomDepth'][:]
-areaCell = fmesh.variables['areaCell'][:]
-bottomDepth = fmesh.variables['bottomDepth'][:]
-maxLevelCell = fmesh.variables['maxLevelCell'][:]
-areaCell = fmesh.variables['areaCell'][:]
+mesh=Mesh('/project/projectdirs/e3sm/inputdata/ocn/mpas-o/oEC60to30v3wLI/oEC60to30v3wLI60lev.171031.nc') # Cryo
+#mesh=Mesh('/global/cscratch1/sd/hoffman2/SLR_tests/oEC60to30v3_60layer.restartFrom_anvil0926.171101.nc') # WC v1
+# Fields are read on first use and cached locally (memory-mapped), so later runs skip the mesh file read.
+latCell = mesh.latCell
+lonCell = mesh.lonCell
+xCell = mesh.xCell
+yCell = mesh.yCell
+depths = mesh.refBottomDepth
+areaCell = mesh.areaCell
+bottomDepth = mesh.bottomDepth
+maxLevelCell = mesh.maxLevelCell
 
 
 pii=3.14159
@@ -51,12 +52,14 @@ mo=1
 
 
 # ---- Choose spatial extent -----
-#idx = np.nonzero(np.logical_and(np.logical_and(latCell<-70.0/180.0*pii, latCell>-85.0/180.0*pii), np.logical_and(lonCell>300.0/360.0*2.0*pii, lonCell<350.0/360.0*2*pii)))[0]  #entire weddell
-#idx = np.nonzero(np.logical_and(np.logical_and(latCell<-70.0/180.0*pii, latCell>-85.0/180.0*pii), np.logical_and(lonCell>270.0/360.0*2.0*pii, lonCell<350.0/360.0*2*pii)))[0]  #entire weddell wider
-#idx = np.nonzero( (latCell<-60.0/180.0*pii) * (latCell>-85.0/180.0*pii) * np.logical_or(lonCell>280.0/360.0*2.0*pii, lonCell<80.0/360.0*2*pii))[0]; size=1.4; fsz=(15,9)  # weddell to Amery 
-idx = np.nonzero( (latCell<-50.0/180.0*pii) )[0] # SO
+# Region masks are defined in steric/regions.py and cached with the mesh.
+regions = Regions(mesh)
+#idx = regions.cells('Weddell')  #entire weddell
+#idx = regions.cells('WeddellWide')  #entire weddell wider
+#idx = regions.cells('WeddellToAmery'); size=1.4; fsz=(15,9)  # weddell to Amery 
+idx = regions.cells('SO')
 
-idx = np.nonzero(latCell<99999999999999999)[0]
+idx = regions.cells('global')
 
 
 print("Found {} cells in idx".format(len(idx)))
@@ -65,94 +68,77 @@ mo=1
 rho_ref = 1036.0 # typical surface density
 #rho_ref = 1026.0 # E3SM rho_sw
 
-def SL(file):
-    rho =            file.variables['timeMonthly_avg_density']       [0, :, :]
-    layerThickness = file.variables['timeMonthly_avg_layerThickness'][0, :, :]
-    ssh = file.variables['timeMonthly_avg_ssh'][0,:]
-    pressAdjSSH = file.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:]
-    nCells = len(file.dimensions['nCells'])
-    SL = np.zeros((nCells,))
-    SLv = np.zeros((nCells,))
-    ht = np.zeros((nCells,))
-    cnt = 0
-    upperOnly = False
-    if upperOnly:
-      # This way is much slower to run
-      for i in idx:
-        maxLev = maxLevelCell[i]
-        bottomDepthHere = bottomDepth[i]
-        thicknessSum = layerThickness[i, :maxLev].sum()
-        thicknessCumSum = layerThickness[i, :maxLev].cumsum()
-        zSurf = bottomDepthHere - thicknessSum
-        zLayerBot = zSurf - thicknessCumSum
-        z = zLayerBot + 0.5 * layerThickness
-        k = np.where(zLayerBot > -700.0)[0][-1]
-        SL[cnt] = -1.0 / rho_ref * (rho[i, :k+1] * layerThickness[i, :k+1]).sum()
-        #print(maxLev, k, zLayerBot.shape)
-        if k+1 <= maxLev-1:
-         if zLayerBot[k+1] < -700.0:
-            # add in partial layer
-            SL[cnt] += -1.0 / rho_ref * (rho[i, k+1] * (zLayerBot[k+1] - -700.0))
-        cnt += 1
-    else:
-      for i in idx:
-
-        maxLev = maxLevelCell[i]
-        #SL[cnt] = -1.0 / rho_ref * (rho[i, :maxLev] * layerThickness[i, :maxLev]).sum()
-        SL[i] = -1.0 / rho_ref * (rho[i, :maxLev] * layerThickness[i, :maxLev]).sum() + bottomDepth[i]
-        SLv[i] = (rho_ref/rho[i, :maxLev] * layerThickness[i, :maxLev]).sum() - bottomDepth[i]
-        ht[i] = layerThickness[i, :maxLev].sum() - bottomDepth[i]
-#        if SL[cnt] > 990:
-#            print('maxLev=',maxLev,' bottomDepth=',bottomDepth[i], ' nz=', rho.shape, ' SL=',SL[cnt], ' ssh=',ssh[i], ' ssh_adj=',pressAdjSSH[i])
-#            print('rho:', rho[i,:])
-#
-#            print('layerThick:', layerThickness[i,:])
-#            sys.exit()
+# Number of cells read and reduced at a time.  None reads each file in one go;
+# set to e.g. 50000 for high resolution meshes so memory is bounded by the chunk.
+chunkSize = None
 
-        #SL[i] = SL[i] - 1.0/rho_ref * (pressAdjSSH[i] - ssh[i]) * 1035.0/1026.0 * rho[i,0]
-        SL[i] = SL[i] - 1.0/rho_ref * (pressAdjSSH[i] - ssh[i]) * 1026.0
-        SLv[i] = SLv[i] +(pressAdjSSH[i] - ssh[i]) * 1035.0/1026.0 * rho_ref/rho[i,0]
-        ht[i] = ht[i] + (pressAdjSSH[i] - ssh[i]) * 1035.0/1026.0
-        cnt += 1
+# Computed fields are cached on disk keyed on the input files, mesh and settings,
+# so rerunning for different figures or regions skips the computation.  ResultCache(False) disables it.
+resultCache = ResultCache()
 
-#    ssh = file.variables['timeMonthly_avg_ssh'][0,:]
-#    pressAdjSSH = file.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:]
-#    SL = SL + (pressAdjSSH - ssh) * 1035.0/1026.0
-    return SL, SLv, ht
+# Run with STERIC_PROFILE=report.json to print the wall time, bytes decoded and peak memory of
+# each stage (mesh, read, integrate, drift, reduce, render) at exit and write them as JSON.
 
+# This option only considers the upper water column (above upperDepth) in SL
+upperOnly = False
+upperDepth = 700.0 # m
 
+# Experiments and periods to compare.  Each (experiment, period) is evaluated only once, in parallel,
+# and all differences and regional means come from those results, so more can be added freely.
 yrs='0120-0129'
-f1=netCDF4.Dataset('/global/cscratch1/sd/hoffman2/SLR_tests/Cryo-G-cases/noEAmelt/mpaso.hist.{}.nc'.format(yrs), 'r')
-f2=netCDF4.Dataset('/global/cscratch1/sd/hoffman2/SLR_tests/Cryo-G-cases/ISMF/mpaso.hist.{}.nc'.format(yrs), 'r')
-SL1, SLv1, ht1 = SL(f1)
-SL2, SLv2, ht2 = SL(f2)
+exps = Comparison(mesh, rho_ref, '/global/cscratch1/sd/hoffman2/SLR_tests/Cryo-G-cases/{exp}/mpaso.hist.{period}.nc',
+                  ['noEAmelt', 'ISMF'], [yrs], iceCorrection='pressure', chunkSize=chunkSize,
+                  upperDepth=(upperDepth if upperOnly else None), cache=resultCache)
+exps.compute()
+r1 = exps.result('noEAmelt', yrs)
+r2 = exps.result('ISMF', yrs)
+SL1, SLv1, ht1 = r1['SL'], r1['SLv'], r1['ht']
+SL2, SLv2, ht2 = r2['SL'], r2['SLv'], r2['ht']
+
+# area-weighted regional means of every pairwise difference
+for (exp1, exp2, period, field), means in exps.summary(regions, fields=('SL', 'pressAdjSSH')).items():
+    print('{} - {}, {}, {}:'.format(exp2, exp1, period, field), ', '.join('{}={:.4g}'.format(k, v) for k, v in means.items()))
 
 SLCdiff = (SL2 - SL1)
+
+# Write every experiment's fields and the differences, with their regional means, to a
+# compressed netCDF file with MPAS dimensions, so later analysis does not need this script.
+saveResults = False
+if saveResults:
+    with ResultStore('steric-G-cases.{}.nc'.format(yrs), mesh, regions) as store:
+        for exp in exps.experiments:
+            for field, values in exps.result(exp, yrs).items():
+                store.put('{}_{}'.format(field, exp), values)
+        for field in ('SL', 'SLv', 'ht', 'pressAdjSSH'):
+            store.put('{}_diff'.format(field), exps.diff('ISMF', 'noEAmelt', yrs, field), 'ISMF - noEAmelt')
 size = 1
+# Draw maps as images remapped to a regular grid (fast, remap indices cached with the mesh)
+# instead of scattering every cell.  Set to False for the original scatter plots.
+mapImages = True
 
 figSL = plt.figure(10, facecolor='w', figsize=(14, 6))
 nrow=1
 ncol=3
 
-idx = np.nonzero( (latCell<-50.0/180.0*pii) )[0] # SO
+idx = regions.cells('SO')
 ax = figSL.add_subplot(nrow, ncol, 1)
 rng=10
 #plt.scatter(lonCell[idx], latCell[idx], s=size, c=SL1[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
-plt.scatter(yCell[idx], xCell[idx], s=size, c=SL1[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, SL1[idx], 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar()
 plt.title('SL1 (m)')
 ax.axis('equal'); plt.axis('off')
   
 ax = figSL.add_subplot(nrow, ncol, 2)
 #plt.scatter(lonCell[idx], latCell[idx], s=size, c=SL2[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
-plt.scatter(yCell[idx], xCell[idx], s=size, c=SL2[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, SL2[idx], 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar()
 plt.title('SL2 (m)')
 ax.axis('equal'); plt.axis('off')
   
 ax = figSL.add_subplot(nrow, ncol, 3)
 rng=0.25
-plt.scatter(yCell[idx], xCell[idx], s=size, c=SLCdiff[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, SLCdiff[idx], 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar(shrink=.3)
 plt.title('SL diff (m)')
 ax.axis('equal'); plt.axis('off')
@@ -164,25 +150,25 @@ figSLv = plt.figure(12, facecolor='w', figsize=(14, 6))
 nrow=1
 ncol=3
 
-idx = np.nonzero( (latCell<-50.0/180.0*pii) )[0] # SO
+idx = regions.cells('SO')
 ax = figSLv.add_subplot(nrow, ncol, 1)
 rng=10
 #plt.scatter(lonCell[idx], latCell[idx], s=size, c=SL1[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
-plt.scatter(yCell[idx], xCell[idx], s=size, c=SLv1[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, SLv1[idx], 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar()
 plt.title('SLv1 (m)')
 ax.axis('equal'); plt.axis('off')
   
 ax = figSLv.add_subplot(nrow, ncol, 2)
 #plt.scatter(lonCell[idx], latCell[idx], s=size, c=SL2[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
-plt.scatter(yCell[idx], xCell[idx], s=size, c=SLv2[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, SLv2[idx], 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar()
 plt.title('SLv2 (m)')
 ax.axis('equal'); plt.axis('off')
   
 ax = figSLv.add_subplot(nrow, ncol, 3)
 rng=0.25
-plt.scatter(yCell[idx], xCell[idx], s=size, c=SLv2[idx]-SLv1[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, SLv2[idx]-SLv1[idx], 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar(shrink=.3)
 plt.title('SLv diff (m)')
 ax.axis('equal'); plt.axis('off')
@@ -192,24 +178,24 @@ fight = plt.figure(11, facecolor='w', figsize=(14, 6))
 nrow=1
 ncol=3
 
-idx = np.nonzero( (latCell<-50.0/180.0*pii) )[0] # SO
+idx = regions.cells('SO')
 ax = fight.add_subplot(nrow, ncol, 1)
 rng=3
-plt.scatter(yCell[idx], xCell[idx], s=size, c=ht1[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, ht1[idx], 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar()
 plt.title('ht1 (m)')
 ax.axis('equal'); plt.axis('off')
   
 ax = fight.add_subplot(nrow, ncol, 2)
 #plt.scatter(lonCell[idx], latCell[idx], s=size, c=SL2[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
-plt.scatter(yCell[idx], xCell[idx], s=size, c=ht2[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, ht2[idx], 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar()
 plt.title('ht2 (m)')
 ax.axis('equal'); plt.axis('off')
   
 ax = fight.add_subplot(nrow, ncol, 3)
 rng=0.25
-plt.scatter(yCell[idx], xCell[idx], s=size, c=ht2[idx]-ht1[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, ht2[idx]-ht1[idx], 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar(shrink=.3)
 plt.title('ht diff (m)')
 ax.axis('equal'); plt.axis('off')
@@ -219,9 +205,9 @@ ax.axis('equal'); plt.axis('off')
 
 
 
-SSH = f1.variables['timeMonthly_avg_ssh'][0,:]
-pressAdjSSH = f1.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:]
-pressAdjSSH2= f2.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:]
+SSH = r1['ssh']
+pressAdjSSH = r1['pressAdjSSH']
+pressAdjSSH2= r2['pressAdjSSH']
 #ax = fig2.add_subplot(nrow, ncol, 1)
 #plt.scatter(lonCell[idx], latCell[idx], s=size, c=pressAdjSSH, vmin=-2, vmax=2, cmap='RdBu_r')
 #plt.colorbar()
@@ -240,14 +226,14 @@ pressAdjSSH2= f2.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:]
 
 
 # SO diffs
-idx = np.nonzero( (latCell<-50.0/180.0*pii) )[0] # SO
+idx = regions.cells('SO')
 fig2 = plt.figure(2, facecolor='w', figsize=(14, 6))
 nrow=1
 ncol=2
 
 ax = fig2.add_subplot(nrow, ncol, 1)
 rng=0.25
-plt.scatter(yCell[idx], xCell[idx], s=size, c=SLCdiff[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, SLCdiff[idx], 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 #plt.scatter(yCell[idx], xCell[idx], s=size, c=SLCdiff[idx], vmin=-0.035, vmax=-0.005, cmap='turbo')
 plt.colorbar(shrink=.3)
 plt.title('steric SL diff (m)')
@@ -257,22 +243,22 @@ ax.axis('equal'); plt.axis('off')
 ax = fig2.add_subplot(nrow, ncol, 2)
 rng=0.1
 #plt.scatter(lonCell[idx], latCell[idx], s=size, c=pressAdjSSH2-pressAdjSSHRef, vmin=-rng, vmax=rng, cmap='RdBu_r')
-plt.scatter(yCell[idx], xCell[idx], s=size, c=pressAdjSSH2[idx]-pressAdjSSH[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, pressAdjSSH2[idx]-pressAdjSSH[idx], 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 ax.axis('equal'); plt.axis('off')
 plt.colorbar(shrink=.3)
 plt.title('SSH diff (m)')
 
 
 # SO diffs - remove global trend
-idx = np.nonzero( (latCell<-50.0/180.0*pii) )[0] # SO
+idx = regions.cells('SO')
 fig4 = plt.figure(4, facecolor='w', figsize=(14, 6))
 nrow=1
 ncol=2
 
 ax = fig4.add_subplot(nrow, ncol, 1)
 rng=0.25
-plt.scatter(yCell[idx], xCell[idx], s=size, c=SLCdiff[idx] - SLCdiff[~idx].mean(), vmin=-rng, vmax=rng, cmap='RdBu_r')
-plt.scatter(yCell[idx], xCell[idx], s=size, c=SLCdiff[idx], cmap='turbo')
+plot_cells(mesh, idx, SLCdiff[idx] - SLCdiff[~idx].mean(), 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, SLCdiff[idx], 'xy', image=mapImages, s=size, cmap='turbo')
 plt.colorbar(shrink=.3)
 plt.title('steric SL diff (m)')
 ax.axis('equal'); plt.axis('off')
@@ -280,7 +266,7 @@ ax.axis('equal'); plt.axis('off')
    
 ax = fig4.add_subplot(nrow, ncol, 2)
 rng=0.1
-plt.scatter(yCell[idx], xCell[idx], s=size, c=pressAdjSSH2[idx]-pressAdjSSH[idx] - (pressAdjSSH2[~idx]-pressAdjSSH[~idx]).mean(), vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, pressAdjSSH2[idx]-pressAdjSSH[idx] - (pressAdjSSH2[~idx]-pressAdjSSH[~idx]).mean(), 'xy', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 ax.axis('equal'); plt.axis('off')
 plt.colorbar(shrink=.3)
 plt.title('SSH diff (m)')
@@ -288,14 +274,14 @@ plt.title('SSH diff (m)')
 
 
 # plot global
-idx = np.nonzero(latCell<99999999999999999)[0]
+idx = regions.cells('global')
 fig3 = plt.figure(3, facecolor='w', figsize=(14, 6))
 nrow=1
 ncol=2
 
 ax = fig3.add_subplot(nrow, ncol, 1)
 rng=0.25
-plt.scatter(lonCell[idx], latCell[idx], s=size, c=SLCdiff[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, SLCdiff[idx], 'latlon', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar(shrink=.3)
 plt.title('steric SL diff (m)')
 ax.axis('equal'); plt.axis('off')
@@ -304,7 +290,7 @@ ax.axis('equal'); plt.axis('off')
 ax = fig3.add_subplot(nrow, ncol, 2)
 rng=0.1
 #plt.scatter(lonCell[idx], latCell[idx], s=size, c=pressAdjSSH2-pressAdjSSHRef, vmin=-rng, vmax=rng, cmap='RdBu_r')
-plt.scatter(lonCell[idx], latCell[idx], s=size, c=pressAdjSSH2[idx]-pressAdjSSH[idx], vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, pressAdjSSH2[idx]-pressAdjSSH[idx], 'latlon', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 ax.axis('equal'); plt.axis('off')
 plt.colorbar(shrink=.3)
 plt.title('SSH diff (m)')
@@ -7,6 +7,8 @@ Griffies, S.M., Yin, J., Durack, P.J., Goddard, P., Bates, S.C., Behrens, E., Be
 
 Griffies, S.M., Greatbatch, R.J., 2012. Physical processes that impact the evolution of global mean sea level in ocean climate models. Ocean Model. 51, 37-72. doi:10.1016/j.ocemod.2012.04.003
 
+The same calculation without the plots, for batch jobs, is steric.historical_change() or
+  python -m steric change MESH --pi PI1 PI2 --piYears 405 495 --hist REF HIST --histYears 1900 2000 --out results.nc
 
 '''
 
@@ -22,19 +24,20 @@ import scipy.signal
 from matplotlib import cm
 import gsw
 from gsw.density import sigma0
+from steric import Mesh, Regions, ResultCache, ResultStore, mpas_xtime, plot_cells, read_steric_vars, steric_decomposition
 
 # Load MPAS-Ocean base mesh fields needed
-#fmesh=netCDF4.Dataset('/project/projectdirs/e3sm/inputdata/ocn/mpas-o/oEC60to30v3wLI/oEC60to30v3wLI60lev.171031.nc') # Cryo
-fmesh=netCDF4.Dataset('/global/cscratch1/sd/hoffman2/SLR_tests/oEC60to30v3_60layer.restartFrom_anvil0926.171101.nc') # WC v1
-latCell = fmesh.variables['latCell'][:]
-lonCell = fmesh.variables['lonCell'][:]
-xCell = fmesh.variables['xCell'][:]
-yCell = fmesh.variables['yCell'][:]
-depths = fmesh.variables['refBottomDepth'][:]
-areaCell = fmesh.variables['areaCell'][:]
-bottomDepth = fmesh.variables['bottomDepth'][:]
-maxLevelCell = fmesh.variables['maxLevelCell'][:]
-areaCell = fmesh.variables['areaCell'][:]
+#mesh=Mesh('/project/projectdirs/e3sm/inputdata/ocn/mpas-o/oEC60to30v3wLI/oEC60to30v3wLI60lev.171031.nc') # Cryo
+mesh=Mesh('/global/cscratch1/sd/hoffman2/SLR_tests/oEC60to30v3_60layer.restartFrom_anvil0926.171101.nc') # WC v1
+# Fields are read on first use and cached locally (memory-mapped), so later runs skip the mesh file read.
+latCell = mesh.latCell
+lonCell = mesh.lonCell
+xCell = mesh.xCell
+yCell = mesh.yCell
+depths = mesh.refBottomDepth
+areaCell = mesh.areaCell
+bottomDepth = mesh.bottomDepth
+maxLevelCell = mesh.maxLevelCell
 
 
 # some constants
@@ -47,6 +50,15 @@ g=9.8101
 path='/project/projectdirs/m3412/simulations/20190819.GMPAS-DIB-IAF-ISMF.T62_oEC60to30v3wLI.cori-knl.testNewGM/archive/ocn/hist'
 path='/global/cscratch1/sd/hoffman2/4xc02'
 path='/global/cscratch1/sd/hoffman2/SLR_tests/lowres_hist_ens1'
+# Every monthly file in path can be processed in parallel instead of using NCO decade means, e.g.
+#from steric import monthly_files, steric_timeseries
+#ts = steric_timeseries(monthly_files(path), maxLevelCell, bottomDepth, areaCell, rho_ref, iceCorrection='thickness')
+#plt.plot(ts['time'], ts['SL_mean'])
+# For a run that is still going, keep a state file and only process the months added since last time:
+#from steric import IncrementalSteric
+#inc = IncrementalSteric('steric_state.nc', mesh, rho_ref, iceCorrection='thickness')
+#inc.update(monthly_files(path))
+#ts = inc.series(); decades = inc.decadal_means()
 # -------------------------
 
 
@@ -54,8 +66,10 @@ path='/global/cscratch1/sd/hoffman2/SLR_tests/lowres_hist_ens1'
 # ---- Choose spatial extent -----
 # Code below adopted from some regional analysis scripts, so there is option to subset the data.
 # But for this script would probably be less confusing to drop this.  Leaving for now.
-#idx = np.nonzero( (latCell<-50.0/180.0*pii) )[0] # SO
-idx = np.nonzero(latCell<99999999999999999)[0] # global ocean
+# Region masks are defined in steric/regions.py and cached with the mesh.
+regions = Regions(mesh)
+#idx = regions.cells('SO')
+idx = regions.cells('global') # global ocean
 
 
 print("Found {} cells in idx".format(len(idx)))
@@ -67,6 +81,17 @@ mo=1
 rho_ref = 1036.0 # typical surface density
 #rho_ref = 1026.0 # E3SM rho_sw
 
+# Number of cells read and reduced at a time.  None reads each file in one go;
+# set to e.g. 50000 for high resolution meshes so memory is bounded by the chunk.
+chunkSize = None
+
+# Computed SL fields are cached on disk keyed on the input files, mesh and settings,
+# so rerunning for different figures or regions skips the computation.  ResultCache(False) disables it.
+resultCache = ResultCache()
+
+# Run with STERIC_PROFILE=report.json to print the wall time, bytes decoded and peak memory of
+# each stage (mesh, read, integrate, drift, reduce, render) at exit and write them as JSON.
+
 def SL(file):
     '''
     Function to calculate sea level for a given file (time slice).
@@ -77,56 +102,40 @@ def SL(file):
     and then taking the difference.
     '''
 
-    SL = np.zeros((len(idx),))
-    rho =            file.variables['timeMonthly_avg_density']       [0, :, :]
-    layerThickness = file.variables['timeMonthly_avg_layerThickness'][0, :, :]
-    ssh = file.variables['timeMonthly_avg_ssh'][0,:]
-    pressAdjSSH = file.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:]
-    cnt = 0
     upperOnly = False
+    upperDepth = 700.0 # m
     if upperOnly:
       # This option only considers upper water column and avoids dealing with drift in deep ocean
-      # This way is much slower to run
-      for i in idx:
-        maxLev = maxLevelCell[i]
-        bottomDepthHere = bottomDepth[i]
-        thicknessSum = layerThickness[i, :maxLev].sum()
-        thicknessCumSum = layerThickness[i, :maxLev].cumsum()
-        zSurf = bottomDepthHere - thicknessSum
-        zLayerBot = zSurf - thicknessCumSum
-        z = zLayerBot + 0.5 * layerThickness
-        k = np.where(zLayerBot > -700.0)[0][-1]
-        SL[cnt] = -1.0 / rho_ref * (rho[i, :k+1] * layerThickness[i, :k+1]).sum()
-        #print(maxLev, k, zLayerBot.shape)
-        if k+1 <= maxLev-1:
-         if zLayerBot[k+1] < -700.0:
-            # add in partial layer
-            SL[cnt] += -1.0 / rho_ref * (rho[i, k+1] * (zLayerBot[k+1] - -700.0))
-        cnt += 1
+      # Only the part of each column above upperDepth is integrated, with the layer that
+      # straddles upperDepth included for the fraction of it above the cutoff.
+      # depth_steric() also takes several cutoffs at once, e.g. (300.0, 700.0, 2000.0, None).
+      SL = resultCache.file_steric(file, mesh, rho_ref, chunkSize=chunkSize, cutoffs=(upperDepth,), cells=idx)[3][0]
     else:
       # This way considers entire water column. This should be ok if model output is drift-corrected.
-      for i in idx:
-
-        maxLev = maxLevelCell[i]
-        #SL[cnt] = -1.0 / rho_ref * (rho[i, :maxLev] * layerThickness[i, :maxLev]).sum()
-        # Calculate SL as column height above the bottom depth.  Question: Does this differ from G14 Eq. 55
-        # which instead subtracts the steric height from the full sea level?  But where do they get 
-        # the "full sea level"?  Should that be 'ssh'?
-        SL[cnt] = -1.0 / rho_ref * (rho[i, :maxLev] * layerThickness[i, :maxLev]).sum() + bottomDepth[i]
-
-        # Check for unphysical values
-        if SL[cnt] > 990:
-            print('maxLev=',maxLev,' bottomDepth=',bottomDepth[i], ' nz=', rho.shape, ' SL=',SL[cnt], ' ssh=',ssh[i], ' ssh_adj=',pressAdjSSH[i])
-            print('rho:', rho[i,:])
-
-            print('layerThick:', layerThickness[i,:])
-            sys.exit()
-
-        # Here complete G14 Eq. 55 by subtracting the steric height from SSH.
-        # The pressAdjSSH term is supposed to account for sea ice, but I'm not sure it works correctly.
-        # Outside of polar regions this should be right?  This doesn't look right, actually.
-        SL[i] = SL[i] + (pressAdjSSH[i] - ssh[i]) * 1035.0/1026.0
-        cnt += 1
+      # All columns are integrated at once using the level mask from maxLevelCell.
+      # Calculate SL as column height above the bottom depth.  Question: Does this differ from G14 Eq. 55
+      # which instead subtracts the steric height from the full sea level?  But where do they get 
+      # the "full sea level"?  Should that be 'ssh'?
+      # Only the contiguous nCells ranges covering idx are read, so a regional idx reads less.
+      SL = resultCache.file_steric(file, mesh, rho_ref, iceCorrection=None, chunkSize=chunkSize, cells=idx)[0]
+
+      # Check for unphysical values, before the sea ice correction
+      bad = np.nonzero(SL > 990)[0]
+      if len(bad) > 0:
+          i = idx[bad[0]]
+          rho, layerThickness, ssh, pressAdjSSH = read_steric_vars(file, slice(i, i+1))
+          print('maxLev=',maxLevelCell[i],' bottomDepth=',bottomDepth[i], ' nz=', rho.shape, ' SL=',SL[bad[0]], ' ssh=',ssh[0], ' ssh_adj=',pressAdjSSH[0])
+          print('rho:', rho[0,:])
+
+          print('layerThick:', layerThickness[0,:])
+          sys.exit()
+
+      # Here complete G14 Eq. 55 by subtracting the steric height from SSH.
+      # The pressAdjSSH term is supposed to account for sea ice, but I'm not sure it works correctly.
+      # Outside of polar regions this should be right?  This doesn't look right, actually.
+      ssh = np.ma.getdata(file.variables['timeMonthly_avg_ssh'][0,:])[idx]
+      pressAdjSSH = np.ma.getdata(file.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:])[idx]
+      SL = SL + (pressAdjSSH - ssh) * 1035.0/1026.0
 
 #    ssh = file.variables['timeMonthly_avg_ssh'][0,:]
 #    pressAdjSSH = file.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:]
@@ -148,6 +157,17 @@ yr_pi2=495 # nominal yr
 #fpi2=netCDF4.Dataset('{0}/mpaso.hist.am.timeSeriesStatsMonthly.{1:04d}-{2:02d}-01.nc'.format(pipath, yr_pi2, mo), 'r')
 fpi2=netCDF4.Dataset('/global/cscratch1/sd/hoffman2/SLR_tests/piControl/0490-0500/mpaso.hist.0490-0500.nc', 'r')
 drift = (SL(fpi2)-SL(fpi1))/(yr_pi2-yr_pi1) # m/yr
+# Alternatively, fit a line (or order=2 for a quadratic) in every cell to the whole monthly PI series.
+# The fit is saved so historical runs can reuse it without rereading piControl.
+#from steric import monthly_files, fit_drift, DriftFit
+#driftFit = fit_drift(monthly_files(pipath), maxLevelCell, bottomDepth, rho_ref, iceCorrection='thickness')
+#driftFit.save('piControl_drift.nc', rho_ref=rho_ref)
+#driftFit = DriftFit.load('piControl_drift.nc')
+#drift = driftFit.rate()[idx] # m/yr
+# Or average any windows of years straight from the monthly files in one pass, instead of NCO:
+#from steric import monthly_files, window_means
+#piWindows = window_means(monthly_files(pipath), maxLevelCell, bottomDepth, rho_ref, [(400, 409), (490, 499)], iceCorrection='thickness')
+#drift = piWindows.rate((490, 499), (400, 409))[idx] # m/yr
 
 
 
@@ -162,13 +182,69 @@ yr_ref = 1900
 fref=netCDF4.Dataset('/global/cscratch1/sd/hoffman2/SLR_tests/lowres_hist_ens/ensMn/mpaso.hist.1900-1909.nc', 'r')
 SLref = SL(fref)
 SLi = SL(f)
+# Or skip the NCO ensemble mean and run every member directly, which also gives the spread, e.g.
+#from steric import ensemble_files, ensemble_steric
+#ensDirs = ['/global/cscratch1/sd/hoffman2/SLR_tests/lowres_hist_ens{}'.format(n) for n in range(1, 6)]
+#ensRef = ensemble_steric(ensemble_files(ensDirs, 'mpaso.hist.1900-1909.nc'), maxLevelCell, bottomDepth, rho_ref, iceCorrection='thickness')
+#ensI = ensemble_steric(ensemble_files(ensDirs, 'mpaso.hist.2000-2009.nc'), maxLevelCell, bottomDepth, rho_ref, iceCorrection='thickness')
+#SLref = ensRef['SL_mean'][idx]
+#SLi = ensI['SL_mean'][idx]
+# Or take the periods from the monthly files with window_means(), e.g. 1993-2007 as in G14:
+#histWindows = window_means(monthly_files(path), maxLevelCell, bottomDepth, rho_ref, [(1900, 1909), (2000, 2009), (1993, 2007)], iceCorrection='thickness')
+#SLref = histWindows.mean((1900, 1909))[idx]
+#SLi = histWindows.mean((2000, 2009))[idx]
 
 # Calculate difference and rate
 SLCdiff = (SLi - SLref)
 SLCrate = (SLi - SLref) / (yr - yr_ref)
 
+# Write the fields, with their regional means, to a compressed netCDF file with MPAS dimensions,
+# so later analysis does not need this script (needs idx to be global).
+saveResults = False
+if saveResults and len(idx) == mesh.nCells:
+    with ResultStore('steric-results.nc', mesh, regions) as store:
+        store.put('SL', np.array([SLref, SLi]), 'steric sea level', xtime=[mpas_xtime(yr_ref), mpas_xtime(yr)])
+        store.put('pressAdjSSH', np.array([fref.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:],
+                                           f.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:]]),
+                  'pressure adjusted SSH', xtime=[mpas_xtime(yr_ref), mpas_xtime(yr)])
+        store.put('drift', drift, 'PI drift in steric sea level', 'm/yr')
+        store.put('SLCrate', SLCrate, 'raw steric sea level change rate', 'm/yr')
+        store.put('SLCrateCorrected', SLCrate - drift, 'drift-corrected steric sea level change rate', 'm/yr')
+
+# Optionally split the steric change into thermosteric and halosteric parts using TEOS-10.
+# Needs temperature and salinity in the files; density is recomputed from them with gsw.
+decompose = False
+if decompose:
+    dec = steric_decomposition(fref, f, mesh, rho_ref, chunkSize=chunkSize)
+    for part in ('total', 'thermo', 'halo', 'nonlinear'):
+        print("{} steric change mean={} mm".format(part, (dec[part]*areaCell).sum()/areaCell.sum()*1000))
+
+# Optionally write where in the water column the change builds up: the cumulative steric change
+# from the surface to every level interface, chunked so it can be read back by depth or region.
+#from steric import write_steric_profiles, read_steric_profile
+#write_steric_profiles('steric_profile_2000-1900.nc', [f.filepath()], mesh, rho_ref, referenceFile=fref.filepath(), chunkSize=chunkSize)
+#depths, profile = read_steric_profile('steric_profile_2000-1900.nc', cells=regions.cells('SO'), depthRange=(0.0, 2000.0))
+
 
 # --- Plots ---
+# Draw maps as images remapped to a regular grid (fast, remap indices cached with the mesh)
+# instead of scattering every cell.  Set to False for the original scatter plots.
+mapImages = True
+# Optionally render the maps headless to files instead, each figure in its own worker process.
+# Panels name fields from the dict below and pick their own region (needs idx to be global).
+renderFiles = False
+if renderFiles and len(idx) == mesh.nCells:
+    from steric import Figure, Panel, render_figures
+    fields = {'SLref': SLref, 'SL': SLi, 'drift': drift, 'SLCrate': SLCrate, 'SLCrateCorrected': SLCrate-drift}
+    render_figures([
+        Figure('steric-SL.png', [Panel('SLref', title='1900 sea level (m)'), Panel('SL', title='2000 sea level (m)')]),
+        Figure('steric-SLC.png', [
+            Panel('drift', scale=1000.0, vmin=-1, vmax=1, title='PI drift in steric sea\nlevel change (mm/yr)'),
+            Panel('SLCrate', scale=1000.0, vmin=-1, vmax=1, title='raw steric sea level\nchange (mm/yr), 2000-1900'),
+            Panel('SLCrateCorrected', scale=1000.0*(yr - yr_ref), vmin=-100, vmax=100, title='drift-corrected steric sea\nlevel change (mm), 2000-1900'),
+            Panel('SLCrateCorrected', scale=1000.0, demean=True, vmin=-1, vmax=1, title='drift-corrected & demeaned steric\nsea level change (mm/yr), 2000-1900')]),
+        Figure('steric-SLC-SO.pdf', [Panel('SLCrateCorrected', region='SO', view='xy', scale=1000.0, vmin=-1, vmax=1)]),
+    ], mesh, fields, image=mapImages)
 
 # Plot the steric sea level height (not the change).
 # Locally sea level varies by 10s of meters from 0!
@@ -179,12 +255,12 @@ ncol=2
 size = 1
 ax = figSL.add_subplot(nrow, ncol, 1)
 rng=1
-plt.scatter(lonCell[idx], latCell[idx], s=size, c=SLref, cmap='RdBu_r')
+plot_cells(mesh, idx, SLref, 'latlon', image=mapImages, s=size, cmap='RdBu_r')
 plt.colorbar()
 plt.title('1900 sea level (m)')
 ax = figSL.add_subplot(nrow, ncol, 2)
 rng=1
-plt.scatter(lonCell[idx], latCell[idx], s=size, c=SLi, cmap='RdBu_r')
+plot_cells(mesh, idx, SLi, 'latlon', image=mapImages, s=size, cmap='RdBu_r')
 plt.colorbar()
 plt.title('2000 sea level (m)')
 
@@ -201,23 +277,23 @@ size = 4
 #plt.scatter(yCell[idx], xCell[idx], s=size, c=SLC)
 size = 1
 rng=1
-plt.scatter(lonCell[idx], latCell[idx], s=size, c=(drift)*1000.0, vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, (drift)*1000.0, 'latlon', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar()
 plt.title('PI drift in steric sea\nlevel change (mm/yr)')
 
 
 ax = fig1.add_subplot(nrow, ncol, 2)
-plt.scatter(lonCell[idx], latCell[idx], s=size, c=(SLCrate)*1000.0, vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, (SLCrate)*1000.0, 'latlon', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar()
 plt.title('raw steric sea level\nchange (mm/yr), 2000-1900')
 
 ax = fig1.add_subplot(nrow, ncol, 3)
-plt.scatter(lonCell[idx], latCell[idx], s=size, c=(SLCrate-drift)*1000.0*(yr - yr_ref), vmin=-100, vmax=100, cmap='RdBu_r')
+plot_cells(mesh, idx, (SLCrate-drift)*1000.0*(yr - yr_ref), 'latlon', image=mapImages, s=size, vmin=-100, vmax=100, cmap='RdBu_r')
 plt.colorbar()
 plt.title('drift-corrected steric sea\nlevel change (mm), 2000-1900')
 
 ax = fig1.add_subplot(nrow, ncol, 4)
-plt.scatter(lonCell[idx], latCell[idx], s=size, c=(SLCrate-drift - (SLCrate-drift).mean())*1000.0, vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, (SLCrate-drift - (SLCrate-drift).mean())*1000.0, 'latlon', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar()
 plt.title('drift-corrected & demeaned steric\nsea level change (mm/yr), 2000-1900')
 
@@ -225,6 +301,11 @@ plt.title('drift-corrected & demeaned steric\nsea level change (mm/yr), 2000-190
 print("drift mean={}".format((drift*areaCell).mean()/areaCell.mean()*1000))
 print("raw SLC mean={}".format((SLCrate*areaCell).mean()/areaCell.mean()*1000))
 print("drift-corrected SLC mean={}".format(((SLCrate-drift)*areaCell).mean()/areaCell.mean()*1000))
+# Same means for every region in the registry from one sparse matrix product (needs idx to be global)
+if len(idx) == mesh.nCells:
+    regionMeans = regions.means(np.array([drift, SLCrate, SLCrate-drift])*1000)
+    for name in regionMeans:
+        print("{}: drift={} raw SLC={} drift-corrected SLC={} (mm/yr)".format(name, *regionMeans[name]))
 #axTS.legend()
 #plt.colorbar()
 plt.draw()
@@ -243,20 +324,20 @@ rng = 1.0
 ax = fig2.add_subplot(nrow, ncol, 1)
 ssh = f.variables['timeMonthly_avg_ssh'][0,:]
 pressAdjSSH = f.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:]
-plt.scatter(lonCell[idx], latCell[idx], s=size, c=pressAdjSSH, vmin=-2.4, vmax=1.2, cmap='RdBu_r')
+plot_cells(mesh, idx, pressAdjSSH, 'latlon', image=mapImages, s=size, vmin=-2.4, vmax=1.2, cmap='RdBu_r')
 plt.colorbar()
 plt.title('SSH, 2000-2009 (m)')
 
 ax = fig2.add_subplot(nrow, ncol, 2)
 sshRef = fref.variables['timeMonthly_avg_ssh'][0,:]
 pressAdjSSHRef = fref.variables['timeMonthly_avg_pressureAdjustedSSH'][0,:]
-plt.scatter(lonCell[idx], latCell[idx], s=size, c=pressAdjSSHRef, vmin=-2.4, vmax=1.2, cmap='RdBu_r')
+plot_cells(mesh, idx, pressAdjSSHRef, 'latlon', image=mapImages, s=size, vmin=-2.4, vmax=1.2, cmap='RdBu_r')
 plt.colorbar()
 plt.title('SSH, 1900-1909 (m)')
 
 ax = fig2.add_subplot(nrow, ncol, 3)
 rng=0.1
-plt.scatter(lonCell[idx], latCell[idx], s=size, c=pressAdjSSH-pressAdjSSHRef, vmin=-rng, vmax=rng, cmap='RdBu_r')
+plot_cells(mesh, idx, pressAdjSSH-pressAdjSSHRef, 'latlon', image=mapImages, s=size, vmin=-rng, vmax=rng, cmap='RdBu_r')
 plt.colorbar()
 plt.title('SSH, difference (m)')
 
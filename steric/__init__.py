@@ -0,0 +1,28 @@
+'''
+Steric sea level calculations for MPAS-Ocean / E3SM output.
+
+Shared by steric-test.py and steric-test-G-cases.py.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from .column import level_mask, column_steric, depth_steric, cell_blocks, read_steric_vars, \
+    file_steric, file_depth_steric, cumulative_steric, cell_ranges, file_steric_cells
+from .timeseries import monthly_files, decimal_year, map_steric, iter_steric, steric_timeseries
+from .drift import DriftFit, fit_drift
+from .ensemble import ensemble_files, ensemble_steric
+from .mesh import Mesh, default_cache_dir, file_key
+from .regions import Regions, regionBoxes, add_region, box_mask, morton_order
+from .remap import remap_indices, remap, plot_cells
+from .experiments import Comparison
+from .cache import ResultCache
+from .teos import steric_decomposition
+from .synthetic import meshSizes, write_mesh, write_output, write_run
+from .profiling import Profiler, profiler
+from .distributed import Decomposition, rank_cells
+from .incremental import IncrementalSteric
+from .store import ResultStore, mpas_xtime
+from .profiles import write_steric_profiles, read_steric_profile
+from .windows import WindowMeans, annual_windows, decadal_windows, stream_windows, window_means
+from .analysis import historical_change
+from .render import Panel, Figure, render_figures
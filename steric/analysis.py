@@ -0,0 +1,45 @@
+'''
+The drift-corrected historical steric change of steric-test.py as a function.
+
+This is the compute part of the script with no plotting, so it can run in
+batch jobs and worker processes: the four decade-mean files are evaluated
+concurrently and only per-cell fields are returned.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from .timeseries import map_steric
+
+changeFields = ('SLref', 'SL', 'drift', 'SLCrate', 'SLCrateCorrected')
+
+
+def historical_change(mesh, rho_ref, piFiles, piYears, histFiles, histYears, iceCorrection='thickness',
+                      upperDepth=None, chunkSize=None, nProcs=None, cache=None):
+    '''
+    Steric sea level change of a historical run corrected for the drift of
+    its piControl run.
+
+    piFiles and histFiles are (earlier, later) pairs of files (e.g. decade
+    means) with nominal years piYears and histYears.  With upperDepth, SL is
+    the integral above upperDepth only (the upperOnly option).  With a
+    ResultCache, results are taken from and kept in it.
+
+    Returns a dict of (nCells,) arrays: 'SLref' and 'SL' (m) for the two
+    historical files, 'drift', 'SLCrate' and 'SLCrateCorrected' (m/yr).
+    '''
+    files = list(piFiles) + list(histFiles)
+    cutoffs = None if upperDepth is None else (upperDepth,)
+    if cache is not None:
+        results = [cache.file_steric(filename, mesh, rho_ref, iceCorrection=iceCorrection, chunkSize=chunkSize,
+                                     cutoffs=cutoffs) for filename in files]
+    else:
+        results = map_steric(files, mesh.maxLevelCell, mesh.bottomDepth, rho_ref,
+                             nProcs=min(nProcs or len(files), len(files)), iceCorrection=iceCorrection,
+                             chunkSize=chunkSize, cutoffs=cutoffs)
+    SL = [result[0] if cutoffs is None else result[3][0] for result in results]
+
+    out = {'SLref': SL[2], 'SL': SL[3]}
+    out['drift'] = (SL[1] - SL[0]) / (piYears[1] - piYears[0])
+    out['SLCrate'] = (SL[3] - SL[2]) / (histYears[1] - histYears[0])
+    out['SLCrateCorrected'] = out['SLCrate'] - out['drift']
+    return out
@@ -0,0 +1,218 @@
+'''
+Benchmarks of the steric calculation on synthetic meshes.
+
+Three cases are timed for each mesh size in synthetic.meshSizes:
+  full     : full-column SL, SLv and ht of one file (the default SL() path)
+  upper    : the depth-limited SL above upperDepth (the upperOnly path)
+  pipeline : the drift/historical analysis of steric-test.py end to end: a
+             drift fit to a year of monthly piControl files, SL of the
+             reference and later historical periods, the drift-corrected
+             rate and its regional means
+Each case runs in a fresh process, so its peak memory (max RSS above the
+process's RSS when the case started) is not hidden by an earlier case.  The
+largest peak RSS of the worker processes a case starts (the pipeline's
+pool) is reported separately, since they are not part of the case
+process's own RSS.
+Throughput is in cells per second summed over all the files a case reads.
+
+Run e.g.
+  python -m steric.benchmark QU240 EC60to30 --workDir /tmp/steric-bench
+Synthetic files are written once to workDir and reused by later runs.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import time
+import traceback
+import multiprocessing
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
+
+import numpy as np
+import netCDF4
+
+from .mesh import Mesh
+from .column import file_steric
+from .drift import fit_drift
+from .regions import Regions
+from .profiling import max_rss
+from . import synthetic
+
+benchmarkCases = ('full', 'upper', 'pipeline')
+
+rho_ref = 1036.0
+upperDepth = 700.0  # m
+
+
+def prepare(workDir, meshName, nMonths=12):
+    '''
+    Write (if not there yet) the synthetic mesh, a year of monthly piControl
+    files and two historical period files for meshName in workDir.
+    Returns a dict of the file names.
+    '''
+    nCells, nVertLevels = synthetic.meshSizes[meshName]
+    meshDir = os.path.join(workDir, meshName)
+    if not os.path.isdir(meshDir):
+        os.makedirs(meshDir)
+    files = {'mesh': os.path.join(meshDir, 'mesh.nc'),
+             'hist1': os.path.join(meshDir, 'mpaso.hist.1900-1909.nc'),
+             'hist2': os.path.join(meshDir, 'mpaso.hist.2000-2009.nc')}
+    if not os.path.exists(files['mesh']):
+        synthetic.write_mesh(files['mesh'], nCells, nVertLevels)
+    mesh = Mesh(files['mesh'], cacheDir=False)
+    if (mesh.nCells, mesh.nVertLevels) != (nCells, nVertLevels):
+        raise ValueError('{} is {} x {}, not the {} x {} of {}; remove {} to write it again'.format(
+            files['mesh'], mesh.nCells, mesh.nVertLevels, nCells, nVertLevels, meshName, meshDir))
+    for n, (name, warming) in enumerate((('hist1', 0.0), ('hist2', 0.5))):
+        if not os.path.exists(files[name]):
+            synthetic.write_output(files[name], mesh, seed=n + 1, warming=warming)
+    piDir = os.path.join(meshDir, 'piControl')
+    mos = list(range(1, nMonths + 1))
+    expected = [os.path.join(piDir, synthetic.monthlyTemplate.format(yr=400, mo=mo)) for mo in mos]
+    if not all(os.path.exists(filename) for filename in expected):
+        synthetic.write_run(piDir, mesh, [400], mos)
+    files['piControl'] = [(400, mo, filename) for mo, filename in zip(mos, expected)]
+    return files
+
+
+def _run_full(files, mesh, chunkSize, nProcs):
+    f = netCDF4.Dataset(files['hist2'], 'r')
+    try:
+        file_steric(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, mask=mesh.levelMask,
+                    chunkSize=chunkSize, work=mesh.work_buffer(chunkSize))
+    finally:
+        f.close()
+    return 1
+
+
+def _run_upper(files, mesh, chunkSize, nProcs):
+    f = netCDF4.Dataset(files['hist2'], 'r')
+    try:
+        file_steric(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, mask=mesh.levelMask,
+                    chunkSize=chunkSize, cutoffs=(upperDepth,), work=mesh.work_buffer(chunkSize))
+    finally:
+        f.close()
+    return 1
+
+
+def _run_pipeline(files, mesh, chunkSize, nProcs):
+    drift = fit_drift(files['piControl'], mesh.maxLevelCell, mesh.bottomDepth, rho_ref,
+                      nProcs=nProcs, iceCorrection='thickness', chunkSize=chunkSize).rate()
+    SL = []
+    for name in ('hist1', 'hist2'):
+        f = netCDF4.Dataset(files[name], 'r')
+        try:
+            SL.append(file_steric(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, mask=mesh.levelMask,
+                                  iceCorrection='thickness', chunkSize=chunkSize,
+                                  work=mesh.work_buffer(chunkSize))[0])
+        finally:
+            f.close()
+    SLCrate = (SL[1] - SL[0]) / 100.0
+    Regions(mesh).mean(np.array([drift, SLCrate, SLCrate - drift]))
+    return len(files['piControl']) + 2
+
+
+_cases = {'full': _run_full, 'upper': _run_upper, 'pipeline': _run_pipeline}
+
+
+def _run_case(case, files, chunkSize, nProcs, queue):
+    try:
+        rss0 = max_rss()
+        t0 = time.time()
+        mesh = Mesh(files['mesh'], cacheDir=False)
+        nFiles = _cases[case](files, mesh, chunkSize, nProcs)
+        queue.put((time.time() - t0, nFiles * mesh.nCells, max_rss() - rss0, max_rss(children=True)))
+    except BaseException:
+        # e.g. a MemoryError at large mesh sizes: report it rather than leave the parent waiting
+        queue.put(traceback.format_exc())
+
+
+def run_case(case, files, chunkSize=None, nProcs=None, timeout=None):
+    '''
+    Time one case in a separate process.  Returns a dict with the wall time
+    (s), throughput (cells/s), peak memory increase (bytes) and the largest
+    peak RSS of any worker process of the case (bytes, 0 if none).
+
+    If the case fails, is killed (e.g. by the out-of-memory killer) or takes
+    longer than timeout seconds, the dict has an 'error' message instead.
+    '''
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_run_case, args=(case, files, chunkSize, nProcs, queue))
+    t0 = time.time()
+    proc.start()
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1.0)
+        except Queue.Empty:
+            if not proc.is_alive():
+                # it may have put its result just before exiting
+                try:
+                    result = queue.get(timeout=1.0)
+                except Queue.Empty:
+                    result = 'process exited with code {} and no result'.format(proc.exitcode)
+            elif timeout is not None and time.time() - t0 > timeout:
+                proc.terminate()
+                result = 'no result after {} s'.format(timeout)
+    proc.join()
+    if not isinstance(result, tuple):
+        return {'case': case, 'error': result}
+    seconds, cells, peakBytes, workerPeakBytes = result
+    return {'case': case, 'seconds': seconds, 'cellsPerSecond': cells / seconds, 'peakBytes': peakBytes,
+            'workerPeakBytes': workerPeakBytes}
+
+
+def run_benchmarks(workDir, meshNames=('QU240',), cases=benchmarkCases, chunkSize=None, nProcs=None,
+                   repeat=1, timeout=None):
+    '''
+    Run every case for every mesh, the best of repeat runs each, printing a
+    line per result.  Returns a list of result dicts; a case that failed
+    has its 'error' (see run_case()) and is not repeated.
+    '''
+    results = []
+    for meshName in meshNames:
+        files = prepare(workDir, meshName)
+        for case in cases:
+            runs = []
+            for _ in range(repeat):
+                runs.append(run_case(case, files, chunkSize, nProcs, timeout))
+                if 'error' in runs[-1]:
+                    break
+            failed = [result for result in runs if 'error' in result]
+            best = failed[0] if failed else min(runs, key=lambda result: result['seconds'])
+            best['mesh'] = meshName
+            best['chunkSize'] = chunkSize
+            results.append(best)
+            if failed:
+                print('{mesh:>10} {case:>9}: FAILED\n{error}'.format(**best))
+                continue
+            print('{mesh:>10} {case:>9}: {seconds:8.2f} s {cellsPerSecond:12.4g} cells/s '
+                  '{peak:8.1f} MB peak {workerPeak:8.1f} MB worker peak'.format(
+                      peak=best['peakBytes'] / 1024.0**2, workerPeak=best['workerPeakBytes'] / 1024.0**2, **best))
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Benchmark the steric calculation on synthetic meshes.')
+    parser.add_argument('meshNames', nargs='*', default=['QU240'],
+                        help='mesh sizes, from: {}'.format(', '.join(synthetic.meshSizes)))
+    parser.add_argument('--workDir', default='steric-benchmark', help='where synthetic files are written')
+    parser.add_argument('--cases', nargs='+', default=list(benchmarkCases), choices=benchmarkCases)
+    parser.add_argument('--chunkSize', type=int, default=None)
+    parser.add_argument('--nProcs', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=None, help='give up on a case after this many seconds')
+    parser.add_argument('--json', default=None, help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.workDir, args.meshNames, args.cases, args.chunkSize, args.nProcs, args.repeat,
+                             args.timeout)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
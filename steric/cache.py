@@ -0,0 +1,139 @@
+'''
+Persistent cache of computed steric fields.
+
+Results are keyed on the identity (path, size, mtime) of the input file and
+the mesh file, rho_ref and the integration settings, so re-running an
+analysis with different figures or regions skips the steric computation.
+The cache is bounded in size; the least recently used entries are removed
+first.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import hashlib
+
+import numpy as np
+import netCDF4
+
+from .column import file_steric, file_steric_cells
+from .mesh import default_cache_dir, file_key
+
+
+class ResultCache(object):
+    '''
+    Size-bounded LRU cache of steric results on disk, by default in
+    $STERIC_CACHE_DIR/results.  cacheDir=False disables it, so it can be
+    switched off without changing the calling code.
+    '''
+
+    def __init__(self, cacheDir=None, maxBytes=2 * 1024**3):
+        if cacheDir is None:
+            cacheDir = os.path.join(default_cache_dir(), 'results')
+        self.cacheDir = cacheDir or None
+        self.maxBytes = maxBytes
+
+    def key(self, filename, mesh, **settings):
+        '''Key for the results of filename on mesh with the given settings.'''
+        parts = [file_key(filename), file_key(mesh.filename)]
+        parts += ['{}={!r}'.format(name, settings[name]) for name in sorted(settings)]
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cacheDir, key + '.npz')
+
+    def get(self, key):
+        '''Dict of arrays stored under key, or None.'''
+        if self.cacheDir is None or not os.path.exists(self._path(key)):
+            return None
+        try:
+            data = np.load(self._path(key))
+            out = dict((name, data[name]) for name in data.files)
+            data.close()
+        except (IOError, OSError, ValueError):
+            # e.g. removed by another process between the check and the load
+            return None
+        # mark as recently used
+        try:
+            os.utime(self._path(key), None)
+        except OSError:
+            # evicted by another process since the load; the arrays are still good
+            pass
+        return out
+
+    def put(self, key, arrays):
+        '''Store a dict of arrays under key, then evict down to maxBytes.'''
+        if self.cacheDir is None:
+            return
+        try:
+            if not os.path.isdir(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            tmp = '{}.{}.tmp.npz'.format(self._path(key)[:-4], os.getpid())
+            np.savez(tmp, **arrays)
+            os.rename(tmp, self._path(key))
+        except (IOError, OSError):
+            # an unwritable cache is not fatal
+            return
+        self.evict()
+
+    def evict(self):
+        '''Remove least recently used entries until the cache fits in maxBytes.'''
+        entries = []
+        for name in os.listdir(self.cacheDir):
+            if not name.endswith('.npz') or '.tmp.' in name:
+                continue
+            path = os.path.join(self.cacheDir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def file_steric(self, file, mesh, rho_ref, iceCorrection='pressure', chunkSize=None, cutoffs=None,
+                    cells=None, maxGap=None):
+        '''
+        file_steric() for file (an open netCDF4 Dataset or a file name) on
+        mesh, taken from the cache when possible.  chunkSize does not change
+        the results, so it is not part of the key.
+
+        With cells (e.g. Regions.cells()), only those cells are computed and
+        returned, and only the nCells ranges covering them are read (see
+        file_steric_cells() for maxGap, which is not part of the key either).
+        '''
+        filename = file.filepath() if isinstance(file, netCDF4.Dataset) else file
+        if cells is not None and len(cells) == mesh.nCells:
+            # the whole mesh: share the cache entry of the full calculation
+            result = self.file_steric(file, mesh, rho_ref, iceCorrection, chunkSize, cutoffs)
+            return tuple(values[..., cells] for values in result)
+        cellsKey = None if cells is None else hashlib.sha1(np.asarray(cells, dtype=np.int64).tobytes()).hexdigest()
+        key = self.key(filename, mesh, rho_ref=float(rho_ref), iceCorrection=iceCorrection,
+                       cutoffs=None if cutoffs is None else tuple(cutoffs), cells=cellsKey)
+        names = ('SL', 'SLv', 'ht') if cutoffs is None else ('SL', 'SLv', 'ht', 'SLz')
+        cached = self.get(key)
+        if cached is not None:
+            return tuple(cached[name] for name in names)
+
+        f = netCDF4.Dataset(filename, 'r') if file is filename else file
+        try:
+            if cells is None:
+                result = file_steric(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, mask=mesh.levelMask,
+                                     iceCorrection=iceCorrection, chunkSize=chunkSize, cutoffs=cutoffs,
+                                     work=mesh.work_buffer(chunkSize))
+            else:
+                result = file_steric_cells(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, cells,
+                                           iceCorrection=iceCorrection, chunkSize=chunkSize, cutoffs=cutoffs,
+                                           maxGap=maxGap)
+        finally:
+            if f is not file:
+                f.close()
+        self.put(key, dict(zip(names, result)))
+        return result
@@ -0,0 +1,154 @@
+'''
+Compute-only command line interface: python -m steric <command> ...
+
+  change      drift-corrected historical steric change (steric-test.py without plots)
+  timeseries  steric fields of every monthly file of a run
+  drift       per-cell drift fit to the monthly files of a piControl run
+  windows     means over year windows of the monthly files
+
+Results go to a ResultStore (or, for drift, a DriftFit) netCDF file and the
+global means are printed.  Nothing is read until a command runs, and
+matplotlib and gsw are never imported; scipy only for regional means.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+
+import numpy as np
+
+
+def _year_pair(text):
+    ''''1900-1909' -> (1900, 1909).'''
+    start, end = text.split('-')
+    return int(start), int(end)
+
+
+def _common(args):
+    '''Mesh, regions and cache for the arguments shared by every command.'''
+    from .mesh import Mesh
+    from .regions import Regions
+    from .cache import ResultCache
+    mesh = Mesh(args.mesh, cacheDir=False if args.noCache else None)
+    regions = None if args.noRegions else Regions(mesh)
+    cache = None if args.noCache else ResultCache()
+    return mesh, regions, cache
+
+
+def _print_means(mesh, name, values):
+    areaCell = np.ma.getdata(mesh.areaCell)
+    print('{} global mean = {:.6g}'.format(name, (values * areaCell).sum() / areaCell.sum()))
+
+
+def run_change(args):
+    from .analysis import historical_change
+    from .store import ResultStore, mpas_xtime
+    mesh, regions, cache = _common(args)
+    out = historical_change(mesh, args.rho_ref, args.pi, args.piYears, args.hist, args.histYears,
+                            iceCorrection=args.iceCorrection, upperDepth=args.upperDepth, chunkSize=args.chunkSize,
+                            nProcs=args.nProcs, cache=cache)
+    for name in ('drift', 'SLCrate', 'SLCrateCorrected'):
+        _print_means(mesh, name + ' (mm/yr)', out[name] * 1000.0)
+    if args.out is not None:
+        with ResultStore(args.out, mesh, regions) as store:
+            store.put('SL', np.array([out['SLref'], out['SL']]), 'steric sea level',
+                      xtime=[mpas_xtime(args.histYears[0]), mpas_xtime(args.histYears[1])])
+            store.put('drift', out['drift'], 'piControl drift in steric sea level', 'm/yr')
+            store.put('SLCrate', out['SLCrate'], 'raw steric sea level change rate', 'm/yr')
+            store.put('SLCrateCorrected', out['SLCrateCorrected'], 'drift-corrected steric sea level change rate',
+                      'm/yr')
+
+
+def run_timeseries(args):
+    from .timeseries import monthly_files, steric_timeseries, stericFields
+    from .store import ResultStore, mpas_xtime
+    mesh, regions, cache = _common(args)
+    files = monthly_files(args.path, yrs=None if args.years is None else range(args.years[0], args.years[1] + 1))
+    ts = steric_timeseries(files, mesh.maxLevelCell, mesh.bottomDepth, mesh.areaCell, args.rho_ref,
+                           nProcs=args.nProcs, iceCorrection=args.iceCorrection, chunkSize=args.chunkSize)
+    for t, SL in zip(ts['time'], ts['SL_mean']):
+        print('{:10.4f} SL global mean = {:.6f} m'.format(t, SL))
+    if args.out is not None:
+        with ResultStore(args.out, mesh, regions) as store:
+            xtime = [mpas_xtime(yr, mo) for yr, mo, _ in files]
+            for field in stericFields:
+                store.put(field, ts[field], xtime=xtime)
+
+
+def run_drift(args):
+    from .timeseries import monthly_files
+    from .drift import fit_drift
+    mesh, regions, cache = _common(args)
+    fit = fit_drift(monthly_files(args.path), mesh.maxLevelCell, mesh.bottomDepth, args.rho_ref, order=args.order,
+                    field=args.field, nProcs=args.nProcs, iceCorrection=args.iceCorrection, chunkSize=args.chunkSize)
+    _print_means(mesh, '{} drift (mm/yr)'.format(args.field), fit.rate() * 1000.0)
+    if args.out is not None:
+        fit.save(args.out, rho_ref=args.rho_ref, field=args.field)
+
+
+def run_windows(args):
+    from .timeseries import monthly_files
+    from .windows import window_means
+    from .store import ResultStore
+    mesh, regions, cache = _common(args)
+    agg = window_means(monthly_files(args.path), mesh.maxLevelCell, mesh.bottomDepth, args.rho_ref, args.window,
+                       fields=(args.field,), nProcs=args.nProcs, iceCorrection=args.iceCorrection,
+                       chunkSize=args.chunkSize)
+    for window in args.window:
+        if not agg.complete(window):
+            print('Warning: only {} months in {}-{}'.format(agg.counts[window], *window))
+        _print_means(mesh, '{} {}-{} (m)'.format(args.field, *window), agg.mean(window, args.field))
+    if args.out is not None:
+        with ResultStore(args.out, mesh, regions) as store:
+            for window in args.window:
+                store.put('{}_{}-{}'.format(args.field, *window), agg.mean(window, args.field),
+                          '{} mean over {}-{}'.format(args.field, *window))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m steric', description='Steric sea level from MPAS-Ocean output.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    def add_parser(name, run, help):
+        sub = subparsers.add_parser(name, help=help)
+        sub.set_defaults(run=run)
+        sub.add_argument('mesh', help='MPAS-Ocean mesh (or restart) file')
+        sub.add_argument('--rho_ref', type=float, default=1036.0)
+        sub.add_argument('--iceCorrection', default='thickness', choices=['pressure', 'thickness', 'none'])
+        sub.add_argument('--chunkSize', type=int, default=None)
+        sub.add_argument('--nProcs', type=int, default=None)
+        sub.add_argument('--noCache', action='store_true', help='do not use or fill the local caches')
+        sub.add_argument('--noRegions', action='store_true', help='do not add regional means to the output')
+        sub.add_argument('--out', default=None, help='netCDF file for the results')
+        return sub
+
+    sub = add_parser('change', run_change, 'drift-corrected historical steric change')
+    sub.add_argument('--pi', nargs=2, required=True, metavar=('EARLY', 'LATE'), help='piControl files')
+    sub.add_argument('--piYears', nargs=2, type=float, required=True, metavar=('EARLY', 'LATE'))
+    sub.add_argument('--hist', nargs=2, required=True, metavar=('REF', 'LATER'), help='historical files')
+    sub.add_argument('--histYears', nargs=2, type=int, required=True, metavar=('REF', 'LATER'))
+    sub.add_argument('--upperDepth', type=float, default=None, help='only integrate above this depth (m)')
+
+    sub = add_parser('timeseries', run_timeseries, 'steric fields of every monthly file in a directory')
+    sub.add_argument('path')
+    sub.add_argument('--years', type=_year_pair, default=None, help='e.g. 1900-1999')
+
+    sub = add_parser('drift', run_drift, 'per-cell drift fit to the monthly files in a directory')
+    sub.add_argument('path')
+    sub.add_argument('--order', type=int, default=1, choices=[1, 2])
+    sub.add_argument('--field', default='SL', choices=['SL', 'SLv', 'ht'])
+
+    sub = add_parser('windows', run_windows, 'means over year windows of the monthly files in a directory')
+    sub.add_argument('path')
+    sub.add_argument('--window', type=_year_pair, nargs='+', required=True, help='e.g. 1900-1909 1993-2007')
+    sub.add_argument('--field', default='SL', choices=['SL', 'SLv', 'ht'])
+
+    args = parser.parse_args(argv)
+    if args.iceCorrection == 'none':
+        args.iceCorrection = None
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+'''
+Whole-array column integrals for steric sea level.
+
+These replace the per-cell loops that used to live in SL() in the analysis
+scripts.  Everything works on (nCells, nVertLevels) arrays at once, with the
+active part of each column described by a boolean level mask built from
+maxLevelCell.  See G14 Appendix B (Eq. 55) for the underlying equations.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+from .profiling import profiler
+
+
+def level_mask(maxLevelCell, nVertLevels):
+    '''
+    Boolean (nCells, nVertLevels) array that is True for the active levels
+    of each column, i.e. k < maxLevelCell.  This is the vectorized
+    equivalent of slicing [i, :maxLev] in a loop.
+    '''
+    maxLevelCell = np.asarray(maxLevelCell)
+    return np.arange(nVertLevels)[np.newaxis, :] < maxLevelCell[:, np.newaxis]
+
+
+def _valid(x, mask):
+    '''
+    Return the plain data of a (possibly masked) array and the level mask with
+    any masked entries switched off, so masked values contribute nothing to
+    sums just like they did with the masked-array loop.
+    '''
+    if np.ma.isMaskedArray(x):
+        mask = mask & ~np.ma.getmaskarray(x)
+    return np.ma.getdata(x), mask
+
+
+def column_steric(rho, layerThickness, ssh, pressAdjSSH, bottomDepth, mask, rho_ref,
+                  iceCorrection='pressure', work=None):
+    '''
+    Full-column steric height for every cell in one pass.
+
+    Returns (SL, SLv, ht):
+      SL  = -1/rho_ref * sum(rho*h) + bottomDepth
+      SLv = sum(rho_ref/rho * h) - bottomDepth   (specific volume form)
+      ht  = sum(h) - bottomDepth                 (thickness anomaly)
+    each including the pressAdjSSH - ssh sea ice correction.
+
+    The SL sea ice term has been written two ways in the scripts, so it is
+    selectable with iceCorrection:
+      'pressure'  : SL -= (pressAdjSSH - ssh) * 1026 / rho_ref   (G-cases)
+      'thickness' : SL += (pressAdjSSH - ssh) * 1035 / 1026      (steric-test)
+      None        : no correction applied to any of the outputs
+
+    work is an optional float array with at least as many rows as there are
+    cells here and nVertLevels columns.  All the 3D arithmetic is done in it,
+    so passing the same buffer for every file avoids allocating temporaries.
+    '''
+    rhoData, rhoMask = _valid(rho, mask)
+    hData, hMask = _valid(layerThickness, mask)
+    both = rhoMask if rhoMask is hMask else rhoMask & hMask
+    bottomDepth = np.ma.getdata(bottomDepth)
+    if work is None:
+        work = np.empty(rhoData.shape)
+    else:
+        work = work[:rhoData.shape[0], :]
+
+    # inactive levels (fill values or zeros) are never touched
+    work.fill(0.0)
+    np.multiply(rhoData, hData, out=work, where=both)
+    rhoH = work.sum(axis=1)
+    work.fill(0.0)
+    np.divide(rho_ref, rhoData, out=work, where=both)
+    np.multiply(work, hData, out=work, where=both)
+    volH = work.sum(axis=1)
+    work.fill(0.0)
+    np.copyto(work, hData, where=hMask)
+    hSum = work.sum(axis=1)
+
+    SL = -1.0 / rho_ref * rhoH + bottomDepth
+    SLv = volH - bottomDepth
+    ht = hSum - bottomDepth
+
+    if iceCorrection is not None:
+        dIce = np.ma.getdata(pressAdjSSH) - np.ma.getdata(ssh)
+        if iceCorrection == 'pressure':
+            SL = SL - 1.0 / rho_ref * dIce * 1026.0
+        elif iceCorrection == 'thickness':
+            SL = SL + dIce * 1035.0 / 1026.0
+        else:
+            raise ValueError('Unknown iceCorrection: {}'.format(iceCorrection))
+        SLv = SLv + dIce * 1035.0 / 1026.0 * rho_ref / rhoData[:, 0]
+        ht = ht + dIce * 1035.0 / 1026.0
+
+    return SL, SLv, ht
+
+
+def cell_blocks(nCells, chunkSize=None):
+    '''
+    Yield slices that cover range(nCells) in contiguous blocks of at most
+    chunkSize cells.  chunkSize=None gives a single block (everything in memory).
+    '''
+    if chunkSize is None:
+        chunkSize = max(nCells, 1)
+    for start in range(0, nCells, chunkSize):
+        yield slice(start, min(start + chunkSize, nCells))
+
+
+# Cells of one column each that cost about as much to read as starting one
+# more read (a hyperslab read has a fixed cost of the order of a millisecond,
+# a column a few microseconds); cell_ranges() merges ranges closer than this.
+readGap = 1000
+
+
+def cell_ranges(cells, maxGap=None):
+    '''
+    The fewest contiguous slices of nCells covering the cell indices cells.
+    Ranges separated by at most maxGap unwanted cells are merged, trading a
+    little extra reading for fewer, larger reads.
+
+    With maxGap=None, readGap is used, and if the ranges would still cost
+    more to read than the one slab from the first to the last cell (counting
+    readGap cells per read), that slab is returned instead.  This is the
+    case for regions whose cells are scattered through the file.
+    '''
+    cells = np.unique(np.asarray(cells, dtype=np.int64))
+    if len(cells) == 0:
+        return []
+    gap = readGap if maxGap is None else maxGap
+    breaks = np.nonzero(np.diff(cells) > gap + 1)[0]
+    starts = np.concatenate(([cells[0]], cells[breaks + 1]))
+    stops = np.concatenate((cells[breaks], [cells[-1]])) + 1
+    if maxGap is None and (stops - starts).sum() + len(starts) * readGap > stops[-1] - starts[0] + readGap:
+        return [slice(int(starts[0]), int(stops[-1]))]
+    return [slice(int(start), int(stop)) for start, stop in zip(starts, stops)]
+
+
+def _cell_range(file, cells):
+    '''(start, nCells) of the cells slice (None for all cells) of a file.'''
+    start, stop, step = (cells or slice(None)).indices(len(file.dimensions['nCells']))
+    if step != 1:
+        raise ValueError('cells must be a contiguous slice')
+    return start, max(stop - start, 0)
+
+
+def read_var(var, index, masked=True):
+    '''
+    var[index], optionally with netCDF4 auto-masking turned off for the read
+    so a plain array comes back without building a mask.  The variable's
+    setting is restored afterwards.
+    '''
+    if masked:
+        data = var[index]
+    else:
+        autoMask = var.mask
+        var.set_auto_mask(False)
+        try:
+            data = var[index]
+        finally:
+            var.set_auto_mask(autoMask)
+    profiler.add_bytes(data.nbytes)
+    return data
+
+
+def read_steric_vars(file, cells=slice(None), masked=True):
+    '''
+    Read the first time slice of the four variables SL() needs from an
+    open netCDF4 Dataset of MPAS-Ocean timeSeriesStatsMonthly output.
+    cells is a slice along nCells, so only that hyperslab is read.
+    With masked=False the arrays are unmasked, fill values and all, and the
+    level mask alone decides which values are used.
+    '''
+    with profiler.stage('read'):
+        rho =            read_var(file.variables['timeMonthly_avg_density'],        (0, cells, slice(None)), masked)
+        layerThickness = read_var(file.variables['timeMonthly_avg_layerThickness'], (0, cells, slice(None)), masked)
+        ssh =            read_var(file.variables['timeMonthly_avg_ssh'],            (0, cells), masked)
+        pressAdjSSH =    read_var(file.variables['timeMonthly_avg_pressureAdjustedSSH'], (0, cells), masked)
+    return rho, layerThickness, ssh, pressAdjSSH
+
+
+def file_steric(file, maxLevelCell, bottomDepth, rho_ref, mask=None, iceCorrection='pressure',
+                chunkSize=None, cutoffs=None, work=None, cells=None):
+    '''
+    Read a file and return (SL, SLv, ht) for all cells.  The level mask can be
+    passed in so it is only built once per mesh.
+
+    cells optionally restricts this to a contiguous slice of nCells; then
+    maxLevelCell, bottomDepth and mask are those of the cells in the slice
+    and the results have one value per cell in it.
+
+    With chunkSize set, density and layerThickness are read and reduced
+    chunkSize cells at a time, so peak memory is set by the chunk rather than
+    the mesh.  The results are the same either way.
+
+    If cutoffs is given, depth_steric() for those cutoff depths is computed
+    from the same read and returned as a fourth item, (SL, SLv, ht, SLz).
+
+    Variables are read without netCDF4 auto-masking: which levels count is
+    set by the level mask.  work is passed on to column_steric(), e.g.
+    Mesh.work_buffer(chunkSize) to reuse one buffer for every file.
+    '''
+    start, nCells = _cell_range(file, cells)
+    if mask is None:
+        mask = level_mask(maxLevelCell, len(file.dimensions['nVertLevels']))
+    if work is None:
+        work = np.empty((max(min(chunkSize or nCells, nCells), 1), mask.shape[1]))
+    SL = np.zeros((nCells,))
+    SLv = np.zeros((nCells,))
+    ht = np.zeros((nCells,))
+    if cutoffs is not None:
+        SLz = np.zeros((len(cutoffs), nCells))
+    for block in cell_blocks(nCells, chunkSize):
+        rho, layerThickness, ssh, pressAdjSSH = read_steric_vars(
+            file, slice(start + block.start, start + block.stop), masked=False)
+        with profiler.stage('integrate'):
+            SL[block], SLv[block], ht[block] = column_steric(
+                rho, layerThickness, ssh, pressAdjSSH, bottomDepth[block], mask[block], rho_ref,
+                iceCorrection=iceCorrection, work=work)
+            if cutoffs is not None:
+                SLz[:, block] = depth_steric(rho, layerThickness, bottomDepth[block], mask[block], rho_ref,
+                                             cutoffs)
+    if cutoffs is not None:
+        return SL, SLv, ht, SLz
+    return SL, SLv, ht
+
+
+def file_steric_cells(file, maxLevelCell, bottomDepth, rho_ref, cells, mask=None, iceCorrection='pressure',
+                      chunkSize=None, cutoffs=None, maxGap=None):
+    '''
+    file_steric() for just the cells with indices cells (e.g. from
+    Regions.cells()), reading only the contiguous nCells ranges that
+    cover them (see cell_ranges(), which with maxGap=None chooses the gap
+    and reads one slab for scattered cells), so a compact region is read in
+    proportion to its size rather than the globe's.  maxLevelCell,
+    bottomDepth and mask are for all cells of the mesh; the results have one
+    value per entry of cells, in the same order.
+    '''
+    cells = np.asarray(cells, dtype=np.int64)
+    nVertLevels = len(file.dimensions['nVertLevels'])
+    maxLevelCell = np.asarray(maxLevelCell)
+    bottomDepth = np.ma.getdata(bottomDepth)
+    ranges = cell_ranges(cells, maxGap)
+    nRead = sum(r.stop - r.start for r in ranges)
+    work = np.empty((max(min(chunkSize or nRead, nRead), 1), nVertLevels))
+    parts = []
+    for r in ranges:
+        rangeMask = level_mask(maxLevelCell[r], nVertLevels) if mask is None else mask[r]
+        parts.append(file_steric(file, maxLevelCell[r], bottomDepth[r], rho_ref, mask=rangeMask,
+                                 iceCorrection=iceCorrection, chunkSize=chunkSize, cutoffs=cutoffs, work=work,
+                                 cells=r))
+    # position of every requested cell in the concatenated ranges
+    readCells = np.concatenate([np.arange(r.start, r.stop) for r in ranges]) if ranges else np.zeros(0, np.int64)
+    where = np.searchsorted(readCells, cells)
+    out = [np.concatenate([part[k] for part in parts], axis=-1)[..., where] if parts else np.zeros((0,))
+           for k in range(3)]
+    if cutoffs is not None:
+        out.append(np.concatenate([part[3] for part in parts], axis=-1)[:, where] if parts
+                   else np.zeros((len(cutoffs), 0)))
+    return tuple(out)
+
+
+def depth_steric(rho, layerThickness, bottomDepth, mask, rho_ref, cutoffs):
+    '''
+    Steric height -1/rho_ref * integral(rho dz) over the upper part of each
+    column, for several cutoff depths (m, positive down) in one pass.
+    A cutoff of None or np.inf means the full column.
+
+    The layer that straddles a cutoff contributes only the fraction of its
+    thickness above the cutoff.  Returns an array of shape
+    (len(cutoffs), nCells).
+    '''
+    rhoData, rhoMask = _valid(rho, mask)
+    hData, hMask = _valid(layerThickness, mask)
+    both = rhoMask & hMask
+    h = np.where(hMask, hData, 0.0)
+    rhoOk = np.where(both, rhoData, 0.0)
+
+    # layer interfaces, z positive up with the sea floor at -bottomDepth
+    zSurf = h.sum(axis=1) - np.ma.getdata(bottomDepth)
+    zBot = zSurf[:, np.newaxis] - h.cumsum(axis=1)
+    zTop = zBot + h
+
+    SLz = np.zeros((len(cutoffs), h.shape[0]))
+    for n, cutoff in enumerate(cutoffs):
+        if cutoff is None or np.isinf(cutoff):
+            dz = h
+        else:
+            # part of each layer that lies above -cutoff
+            dz = np.clip(zTop - np.maximum(zBot, -cutoff), 0.0, h)
+        SLz[n, :] = -1.0 / rho_ref * (rhoOk * dz).sum(axis=1)
+    return SLz
+
+
+def cumulative_steric(rho, layerThickness, mask, rho_ref, out=None):
+    '''
+    Cumulative steric height -1/rho_ref * sum(rho * h) from the surface down
+    to every level interface, as a (nCells, nVertLevels+1) array: column 0
+    is the surface (always 0) and column k the bottom of level k-1, so the
+    interface at maxLevelCell is the sea floor and holds the full-column
+    integral.  Interfaces below the sea floor are NaN.
+
+    This is one cumulative sum over the level axis, written into out if
+    given (e.g. a view of a larger output block).
+    '''
+    rhoData, rhoMask = _valid(rho, mask)
+    hData, hMask = _valid(layerThickness, mask)
+    both = rhoMask if rhoMask is hMask else rhoMask & hMask
+    nCells, nVertLevels = rhoData.shape
+    if out is None:
+        out = np.empty((nCells, nVertLevels + 1))
+    out[:, 0] = 0.0
+    layers = out[:, 1:]
+    layers.fill(0.0)
+    np.multiply(rhoData, hData, out=layers, where=both)
+    layers *= -1.0 / rho_ref
+    np.cumsum(layers, axis=1, out=layers)
+    # interface k is active if level k-1 is, i.e. k <= maxLevelCell
+    layers[~mask] = np.nan
+    return out
+
+
+def file_depth_steric(file, maxLevelCell, bottomDepth, rho_ref, cutoffs, mask=None, chunkSize=None,
+                      cells=None):
+    '''
+    Read a file once and return depth_steric() for all the cutoff depths,
+    optionally streaming chunkSize cells at a time, and for a slice of cells,
+    as in file_steric().
+    '''
+    start, nCells = _cell_range(file, cells)
+    if mask is None:
+        mask = level_mask(maxLevelCell, len(file.dimensions['nVertLevels']))
+    SLz = np.zeros((len(cutoffs), nCells))
+    for block in cell_blocks(nCells, chunkSize):
+        rho, layerThickness, ssh, pressAdjSSH = read_steric_vars(
+            file, slice(start + block.start, start + block.stop), masked=False)
+        with profiler.stage('integrate'):
+            SLz[:, block] = depth_steric(rho, layerThickness, bottomDepth[block], mask[block], rho_ref, cutoffs)
+    return SLz
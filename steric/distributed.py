@@ -0,0 +1,208 @@
+'''
+Domain-decomposed steric calculation with MPI (mpi4py).
+
+Every column is independent, so each rank takes a contiguous slab of nCells
+and only ever reads that hyperslab of each file.  The only communication is
+in the reductions: area-weighted global and regional means and the global
+mean of a drift fit are summed over ranks with allreduce, and per-cell
+fields are only sent to rank 0 when they are wanted for output.
+
+Run e.g.
+  mpirun -n 4 python -m steric.distributed mesh.nc /path/to/run/hist --piControl /path/to/piControl/hist
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+
+import numpy as np
+import netCDF4
+
+from .column import level_mask, file_steric
+from .timeseries import decimal_year, stericFields
+from .drift import DriftFit
+from .profiling import profiler
+
+
+def rank_cells(nCells, rank, size):
+    '''Contiguous slice of nCells owned by rank out of size, as equal as possible.'''
+    base, extra = divmod(nCells, size)
+    start = rank * base + min(rank, extra)
+    return slice(start, start + base + (1 if rank < extra else 0))
+
+
+class Decomposition(object):
+    '''
+    The slab of a Mesh owned by this rank of comm (default MPI.COMM_WORLD).
+    Only the slab of each mesh field is read from the mesh file, and the
+    level mask is built for the slab alone.
+    '''
+
+    def __init__(self, mesh, comm=None):
+        if comm is None:
+            from mpi4py import MPI
+            comm = MPI.COMM_WORLD
+        self.mesh = mesh
+        self.comm = comm
+        self.rank = comm.Get_rank()
+        self.size = comm.Get_size()
+        with profiler.stage('mesh'):
+            f = netCDF4.Dataset(mesh.filename, 'r')
+            try:
+                nCellsGlobal = len(f.dimensions['nCells'])
+                nVertLevels = len(f.dimensions['nVertLevels'])
+                self.slabs = [rank_cells(nCellsGlobal, rank, self.size) for rank in range(self.size)]
+                self.cells = self.slabs[self.rank]
+                # hyperslab reads, rather than the whole fields through the Mesh
+                self.maxLevelCell = np.ma.getdata(f.variables['maxLevelCell'][self.cells])
+                self.bottomDepth = np.ma.getdata(f.variables['bottomDepth'][self.cells])
+                self.areaCell = np.ma.getdata(f.variables['areaCell'][self.cells])
+            finally:
+                f.close()
+            profiler.add_bytes(self.maxLevelCell.nbytes + self.bottomDepth.nbytes + self.areaCell.nbytes)
+        self.mask = level_mask(self.maxLevelCell, nVertLevels)
+        self.areaTotal = comm.allreduce(self.areaCell.sum())
+        self._work = {}
+
+    @property
+    def nCells(self):
+        '''Number of cells on this rank.'''
+        return self.cells.stop - self.cells.start
+
+    def file_steric(self, filename, rho_ref, iceCorrection='pressure', chunkSize=None, cutoffs=None):
+        '''file_steric() of filename for the cells of this rank.'''
+        nRows = max(min(chunkSize or self.nCells, self.nCells), 1)
+        if nRows not in self._work:
+            self._work[nRows] = np.empty((nRows, self.mask.shape[1]))
+        f = netCDF4.Dataset(filename, 'r')
+        try:
+            return file_steric(f, self.maxLevelCell, self.bottomDepth, rho_ref, mask=self.mask,
+                               iceCorrection=iceCorrection, chunkSize=chunkSize, cutoffs=cutoffs,
+                               work=self._work[nRows], cells=self.cells)
+        finally:
+            f.close()
+
+    def global_mean(self, field):
+        '''
+        Area-weighted mean over all ranks of field, with the cells of this rank
+        along the last axis.  Every rank gets the result.
+        '''
+        with profiler.stage('reduce'):
+            local = np.asarray(np.dot(np.ma.getdata(field), self.areaCell))
+            return self.comm.allreduce(local) / self.areaTotal
+
+    def region_means(self, regions, field):
+        '''
+        Regions.means() of a field distributed over the ranks; only this rank's
+        columns of the weight matrix are used, then the sums are combined.
+        '''
+        weights = regions.weights()[:, self.cells]
+        with profiler.stage('reduce'):
+            local = weights.dot(np.ma.getdata(field).T)
+            means = self.comm.allreduce(np.asarray(local))
+            means[np.asarray(regions.weights().sum(axis=1)).ravel() == 0] = np.nan
+        return OrderedDict(zip(regions.names, means))
+
+    def gather(self, field, root=0):
+        '''
+        Full (..., nCells) field on root from the slab of every rank, None on
+        the other ranks.  The whole field goes in one Gatherv, with cells
+        along the first axis so each rank's part is contiguous.
+        '''
+        field = np.ma.getdata(field)
+        shape = field.shape[:-1]
+        nRows = int(np.prod(shape))
+        # (nLocal, nRows): each rank's cells, with all the rows of each
+        local = np.ascontiguousarray(field.reshape((nRows, -1)).T, dtype=np.float64)
+        counts = [(s.stop - s.start) * nRows for s in self.slabs]
+        if self.rank != root:
+            self.comm.Gatherv(local, None, root=root)
+            return None
+        full = np.empty((self.slabs[-1].stop, nRows))
+        self.comm.Gatherv(local, (full, counts), root=root)
+        return np.ascontiguousarray(full.T).reshape(shape + (full.shape[0],))
+
+    def timeseries(self, files, rho_ref, fields=stericFields, iceCorrection='pressure', chunkSize=None):
+        '''
+        steric_timeseries() with the cells split over the ranks.  Every rank
+        gets 'time' and the '<field>_mean' global means; the (nTimes, nCells)
+        fields hold only this rank's cells (see gather()).
+        '''
+        nTimes = len(files)
+        out = {'time': np.zeros((nTimes,))}
+        for field in fields:
+            out[field] = np.zeros((nTimes, self.nCells))
+        for t, (yr, mo, filename) in enumerate(files):
+            out['time'][t] = decimal_year(yr, mo)
+            for field, values in zip(stericFields, self.file_steric(filename, rho_ref, iceCorrection, chunkSize)):
+                if field in fields:
+                    out[field][t, :] = values
+        # one reduction for every field and time
+        means = self.global_mean(np.array([out[field] for field in fields]))
+        for field, mean in zip(fields, means):
+            out[field + '_mean'] = mean
+        return out
+
+    def fit_drift(self, files, rho_ref, order=1, field='SL', iceCorrection='pressure', chunkSize=None):
+        '''
+        fit_drift() of this rank's cells.  The time sums are the same on every
+        rank, so the fit itself needs no communication; see drift_mean() and
+        gather_fit() for the global results.
+        '''
+        k = stericFields.index(field)
+        fit = DriftFit(self.nCells, order=order)
+        for yr, mo, filename in files:
+            fit.add(decimal_year(yr, mo), self.file_steric(filename, rho_ref, iceCorrection, chunkSize)[k])
+        return fit
+
+    def drift_mean(self, fit, t=None):
+        '''Area-weighted global mean drift rate of a fit from fit_drift().'''
+        return self.global_mean(fit.rate(t))
+
+    def gather_fit(self, fit, root=0):
+        '''The DriftFit of all cells on root (e.g. to save()), None elsewhere.'''
+        ySums = self.gather(fit.ySums, root)
+        if self.rank != root:
+            return None
+        full = DriftFit(ySums.shape[-1], order=fit.order, t0=fit.t0)
+        full.tSums[:] = fit.tSums
+        full.ySums[:] = ySums
+        full.tMin = fit.tMin
+        full.tMax = fit.tMax
+        return full
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from .mesh import Mesh
+    from .timeseries import monthly_files
+
+    parser = argparse.ArgumentParser(description='Steric time series of a run, cells split over MPI ranks.')
+    parser.add_argument('meshFile')
+    parser.add_argument('path', help='directory of timeSeriesStatsMonthly files')
+    parser.add_argument('--piControl', default=None, help='directory of piControl monthly files to fit the drift to')
+    parser.add_argument('--rho_ref', type=float, default=1036.0)
+    parser.add_argument('--iceCorrection', default='thickness')
+    parser.add_argument('--chunkSize', type=int, default=None)
+    parser.add_argument('--driftFile', default=None, help='save the gathered drift fit here')
+    parser.add_argument('--out', default=None, help='save the time series of global means here (.npz)')
+    args = parser.parse_args()
+
+    dec = Decomposition(Mesh(args.meshFile))
+    ts = dec.timeseries(monthly_files(args.path), args.rho_ref, iceCorrection=args.iceCorrection,
+                        chunkSize=args.chunkSize)
+    if dec.rank == 0:
+        for t, SL in zip(ts['time'], ts['SL_mean']):
+            print('{:10.4f} SL mean = {:.6f} m'.format(t, SL))
+        if args.out is not None:
+            np.savez(args.out, **dict((name, ts[name]) for name in ts if name == 'time' or name.endswith('_mean')))
+    if args.piControl is not None:
+        fit = dec.fit_drift(monthly_files(args.piControl), args.rho_ref, iceCorrection=args.iceCorrection,
+                            chunkSize=args.chunkSize)
+        driftMean = dec.drift_mean(fit)
+        fit = dec.gather_fit(fit)
+        if dec.rank == 0:
+            print('drift mean = {} mm/yr'.format(driftMean * 1000.0))
+            if args.driftFile is not None:
+                fit.save(args.driftFile, rho_ref=args.rho_ref)
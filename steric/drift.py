@@ -0,0 +1,137 @@
+'''
+Per-cell drift of steric sea level fitted to a whole piControl series.
+
+Instead of differencing two decade means, a least-squares polynomial (a line
+by default, optionally a quadratic) is fitted in every cell.  The fit only
+keeps running sums, so the monthly files are read one at a time and hundreds
+of years of control run never have to be in memory together.  Because every
+cell shares the same times, the time sums are scalars and only the data sums
+are per cell.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import netCDF4
+
+from .timeseries import iter_steric, stericFields
+from .profiling import profiler
+
+
+class DriftFit(object):
+    '''
+    Running least-squares fit of y = c0 + c1*(t-t0) [+ c2*(t-t0)**2] per cell.
+
+    Call add() with each time (in years) and the field for all cells, then
+    rate() for the drift in units per year.  save() and DriftFit.load() keep
+    the fit (and the running sums, so it can be extended later) in a small
+    netCDF file.
+    '''
+
+    def __init__(self, nCells, order=1, t0=None):
+        if order not in (1, 2):
+            raise ValueError('order must be 1 (linear) or 2 (quadratic)')
+        self.nCells = nCells
+        self.order = order
+        # times are taken relative to t0 to keep the sums well conditioned
+        self.t0 = t0
+        self.tSums = np.zeros((2 * order + 1,))        # sum of (t-t0)**p, p = 0..2*order
+        self.ySums = np.zeros((order + 1, nCells))     # sum of y*(t-t0)**p, p = 0..order
+        self.tMin = np.inf
+        self.tMax = -np.inf
+
+    @property
+    def nTimes(self):
+        return int(self.tSums[0])
+
+    def add(self, t, y):
+        '''Add the field y (nCells,) at time t (years) to the fit.'''
+        with profiler.stage('drift'):
+            if self.t0 is None:
+                self.t0 = t
+            dt = t - self.t0
+            self.tSums += dt ** np.arange(2 * self.order + 1)
+            y = np.ma.getdata(y)
+            for p in range(self.order + 1):
+                self.ySums[p, :] += y * dt ** p
+            self.tMin = min(self.tMin, t)
+            self.tMax = max(self.tMax, t)
+
+    def coefficients(self):
+        '''(order+1, nCells) array of polynomial coefficients in powers of t-t0.'''
+        if self.nTimes <= self.order:
+            raise ValueError('Need at least {} times for an order {} fit, have {}'.format(
+                self.order + 1, self.order, self.nTimes))
+        n = self.order + 1
+        A = np.array([[self.tSums[i + j] for j in range(n)] for i in range(n)])
+        with profiler.stage('drift'):
+            return np.linalg.solve(A, self.ySums)
+
+    def rate(self, t=None):
+        '''
+        Drift (field units per year) for every cell.  For a quadratic fit this
+        is the slope at time t, by default the middle of the fitted period.
+        '''
+        c = self.coefficients()
+        if self.order == 1:
+            return c[1, :]
+        if t is None:
+            t = 0.5 * (self.tMin + self.tMax)
+        return c[1, :] + 2.0 * c[2, :] * (t - self.t0)
+
+    def evaluate(self, t):
+        '''Fitted value of the field at time t for every cell.'''
+        c = self.coefficients()
+        return sum(c[p, :] * (t - self.t0) ** p for p in range(self.order + 1))
+
+    def save(self, filename, **attrs):
+        '''Write the fit to a netCDF file.  Extra keyword arguments become global attributes.'''
+        f = netCDF4.Dataset(filename, 'w')
+        try:
+            f.createDimension('nCells', self.nCells)
+            f.createDimension('nCoefficients', self.order + 1)
+            f.createDimension('nTimeSums', 2 * self.order + 1)
+            f.order = self.order
+            f.t0 = self.t0
+            f.tMin = self.tMin
+            f.tMax = self.tMax
+            for name, value in attrs.items():
+                setattr(f, name, value)
+            var = f.createVariable('drift', 'f8', ('nCells',))
+            var.units = 'per year'
+            var.long_name = 'fitted drift rate'
+            var[:] = self.rate()
+            f.createVariable('coefficients', 'f8', ('nCoefficients', 'nCells'))[:] = self.coefficients()
+            f.createVariable('tSums', 'f8', ('nTimeSums',))[:] = self.tSums
+            f.createVariable('ySums', 'f8', ('nCoefficients', 'nCells'))[:] = self.ySums
+        finally:
+            f.close()
+
+    @classmethod
+    def load(cls, filename):
+        '''Read a fit written by save().'''
+        f = netCDF4.Dataset(filename, 'r')
+        try:
+            fit = cls(len(f.dimensions['nCells']), order=int(f.order), t0=float(f.t0))
+            fit.tMin = float(f.tMin)
+            fit.tMax = float(f.tMax)
+            fit.tSums[:] = f.variables['tSums'][:]
+            fit.ySums[:] = f.variables['ySums'][:]
+        finally:
+            f.close()
+        return fit
+
+
+def fit_drift(files, maxLevelCell, bottomDepth, rho_ref, order=1, field='SL', nProcs=None,
+              iceCorrection='pressure', chunkSize=None):
+    '''
+    Fit the drift of field ('SL', 'SLv' or 'ht') over the monthly piControl
+    files (as returned by monthly_files()), streaming one file at a time.
+    Returns a DriftFit; use .rate() for the drift in m/yr.
+    '''
+    k = stericFields.index(field)
+    fit = DriftFit(len(maxLevelCell), order=order)
+    for t, result in iter_steric(files, maxLevelCell, bottomDepth, rho_ref, nProcs=nProcs,
+                                 iceCorrection=iceCorrection, chunkSize=chunkSize):
+        fit.add(t, result[k])
+    return fit
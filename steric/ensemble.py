@@ -0,0 +1,52 @@
+'''
+Steric sea level for an ensemble of runs, computed member by member in
+parallel and reduced to the ensemble mean, spread and member anomalies.
+
+This replaces averaging the members with NCO before the steric calculation
+(the lowres_hist_ens/ensMn files), and keeps the spread that the averaged
+files throw away.  Note the ensemble mean of SL is not exactly SL of the
+ensemble-mean fields, since SL depends on the product rho*h.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+
+import numpy as np
+
+from .timeseries import map_steric, stericFields
+
+
+def ensemble_files(memberDirs, filename):
+    '''The same file (e.g. mpaso.hist.2000-2009.nc) in each member directory.'''
+    return [os.path.join(memberDir, filename) for memberDir in memberDirs]
+
+
+def ensemble_steric(filenames, maxLevelCell, bottomDepth, rho_ref, nProcs=None, fields=stericFields,
+                    iceCorrection='pressure', chunkSize=None):
+    '''
+    Run the steric calculation on one file per member concurrently.
+
+    Returns a dict with, for each requested field, '<field>_mean' and
+    '<field>_std' (nCells,) and '<field>_anom' (nMembers, nCells), the
+    anomaly of each member from the ensemble mean.  The standard deviation
+    uses N-1 degrees of freedom when there is more than one member.
+    '''
+    nMembers = len(filenames)
+    nCells = len(maxLevelCell)
+    members = dict((field, np.zeros((nMembers, nCells))) for field in fields)
+    results = map_steric(filenames, maxLevelCell, bottomDepth, rho_ref, nProcs=nProcs,
+                         iceCorrection=iceCorrection, chunkSize=chunkSize)
+    for m, result in enumerate(results):
+        for field, values in zip(stericFields, result):
+            if field in fields:
+                members[field][m, :] = values
+
+    out = {'nMembers': nMembers}
+    ddof = 1 if nMembers > 1 else 0
+    for field in fields:
+        mean = members[field].mean(axis=0)
+        out[field + '_mean'] = mean
+        out[field + '_std'] = members[field].std(axis=0, ddof=ddof)
+        out[field + '_anom'] = members[field] - mean[np.newaxis, :]
+    return out
@@ -0,0 +1,123 @@
+'''
+Compare any number of experiments and periods.
+
+Each (experiment, period) is evaluated once: SL, SLv, ht and the SSH fields
+are kept, and every pairwise difference and regional summary is built from
+those memoized results.  A matrix of N experiments therefore needs N steric
+evaluations per period, however many differences are looked at.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+import netCDF4
+
+from .timeseries import map_steric
+
+experimentFields = ('SL', 'SLv', 'ht', 'ssh', 'pressAdjSSH')
+
+
+class Comparison(object):
+    '''
+    Steric results for experiments x periods, with files found from
+    fileTemplate, e.g.
+      '/global/cscratch1/sd/hoffman2/SLR_tests/Cryo-G-cases/{exp}/mpaso.hist.{period}.nc'
+
+    With upperDepth set, SL is the depth-limited integral above upperDepth
+    (the upperOnly option of the scripts) instead of the full column.
+    With a ResultCache, results are also kept on disk between runs.
+    '''
+
+    def __init__(self, mesh, rho_ref, fileTemplate, experiments, periods, iceCorrection='pressure',
+                 chunkSize=None, nProcs=None, upperDepth=None, cache=None):
+        self.mesh = mesh
+        self.rho_ref = rho_ref
+        self.fileTemplate = fileTemplate
+        self.experiments = list(experiments)
+        self.periods = list(periods)
+        self.iceCorrection = iceCorrection
+        self.chunkSize = chunkSize
+        self.nProcs = nProcs
+        self.upperDepth = upperDepth
+        self.cache = cache
+        self._results = {}
+
+    def filename(self, exp, period):
+        return self.fileTemplate.format(exp=exp, period=period)
+
+    def compute(self, keys=None):
+        '''
+        Evaluate every (experiment, period) in keys (default: all of them)
+        that has not been evaluated yet, in parallel.
+        '''
+        if keys is None:
+            keys = list(itertools.product(self.experiments, self.periods))
+        todo = [key for key in keys if key not in self._results]
+        cutoffs = None if self.upperDepth is None else (self.upperDepth,)
+        cacheKeys = {}
+        if self.cache is not None:
+            for key in todo:
+                cacheKeys[key] = self.cache.key(self.filename(*key), self.mesh, kind='comparison',
+                                                rho_ref=float(self.rho_ref), iceCorrection=self.iceCorrection,
+                                                cutoffs=cutoffs)
+                cached = self.cache.get(cacheKeys[key])
+                if cached is not None:
+                    self._results[key] = cached
+            todo = [key for key in todo if key not in self._results]
+        if len(todo) == 0:
+            return
+        results = map_steric([self.filename(*key) for key in todo], self.mesh.maxLevelCell,
+                             self.mesh.bottomDepth, self.rho_ref, nProcs=min(self.nProcs or len(todo), len(todo)),
+                             iceCorrection=self.iceCorrection, chunkSize=self.chunkSize, cutoffs=cutoffs)
+        for key, result in zip(todo, results):
+            out = {'SL': result[0], 'SLv': result[1], 'ht': result[2]}
+            if cutoffs is not None:
+                out['SL'] = result[3][0]
+            f = netCDF4.Dataset(self.filename(*key), 'r')
+            try:
+                out['ssh'] = np.ma.getdata(f.variables['timeMonthly_avg_ssh'][0, :])
+                out['pressAdjSSH'] = np.ma.getdata(f.variables['timeMonthly_avg_pressureAdjustedSSH'][0, :])
+            finally:
+                f.close()
+            self._results[key] = out
+            if self.cache is not None:
+                self.cache.put(cacheKeys[key], out)
+
+    def result(self, exp, period):
+        '''Dict of the experimentFields for one experiment and period.'''
+        self.compute([(exp, period)])
+        return self._results[(exp, period)]
+
+    def diff(self, exp2, exp1, period, field='SL', period1=None):
+        '''field of (exp2, period) minus field of (exp1, period1 or period).'''
+        if period1 is None:
+            period1 = period
+        self.compute([(exp2, period), (exp1, period1)])
+        return self._results[(exp2, period)][field] - self._results[(exp1, period1)][field]
+
+    def pairs(self):
+        '''All (exp1, exp2) pairs with exp1 listed before exp2.'''
+        return list(itertools.combinations(self.experiments, 2))
+
+    def pairwise(self, period, field='SL'):
+        '''OrderedDict of exp2 - exp1 for every pair, keyed on (exp1, exp2).'''
+        self.compute()
+        return OrderedDict(((exp1, exp2), self.diff(exp2, exp1, period, field))
+                           for exp1, exp2 in self.pairs())
+
+    def summary(self, regions, fields=experimentFields):
+        '''
+        Area-weighted regional means of every pairwise difference, as an
+        OrderedDict keyed on (exp1, exp2, period, field) of
+        OrderedDict(region -> mean).
+        '''
+        self.compute()
+        out = OrderedDict()
+        for period in self.periods:
+            for field in fields:
+                for (exp1, exp2), d in self.pairwise(period, field).items():
+                    out[(exp1, exp2, period, field)] = regions.means(d)
+        return out
@@ -0,0 +1,230 @@
+'''
+Incremental steric time series for runs that are still going.
+
+A state file (netCDF) keeps which monthly files have been processed, their
+results and running sums for decade means.  Each update() only computes the
+monthly files that are not in it yet and appends them, so monitoring a run
+every night costs O(new files) rather than O(length of the run).
+
+State file contents:
+  Time dimension (unlimited), one record per processed month, in the order
+  they were processed:
+    yr, mo, time          year, month and decimal year
+    <field>_mean          area-weighted global mean of each field
+    <field>               (Time, nCells) per-cell results, if keepCells
+  nDecades dimension (unlimited), with two slots (nSlots) per decade:
+    decade                first year of the decade, e.g. 1900
+    nMonths               (nDecades, nSlots) number of months summed in each slot
+    <field>_sum           (nDecades, nSlots, nCells) sum of the monthly fields
+The mesh, rho_ref, iceCorrection, fields and keepCells are global
+attributes, and an existing state file made with different ones is refused.
+
+A month is written in an order that makes each step the commit point of
+the one before, so a killed update never leaves a month half counted:
+  1. its record: the means and per-cell fields, then time, mo and, last, yr
+  2. the new decade sums, into the slot not in use
+  3. nMonths of that slot, which makes it the one in use (the larger count)
+A record with no yr, or whose month is not in the decade sums yet, is not
+processed: it is written again by the next update().
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+import netCDF4
+
+from .mesh import file_key
+from .timeseries import map_steric, decimal_year, stericFields
+
+
+class IncrementalSteric(object):
+    '''
+    Steric time series and decade means of a run kept in stateFile and
+    extended with update(monthly_files(path)).
+    '''
+
+    def __init__(self, stateFile, mesh, rho_ref, iceCorrection='pressure', fields=stericFields, keepCells=True,
+                 chunkSize=None, nProcs=None):
+        self.stateFile = stateFile
+        self.mesh = mesh
+        self.rho_ref = rho_ref
+        self.iceCorrection = iceCorrection
+        self.fields = tuple(fields)
+        self.keepCells = keepCells
+        self.chunkSize = chunkSize
+        self.nProcs = nProcs
+        self._attrs = {'meshKey': file_key(mesh.filename), 'rho_ref': float(rho_ref),
+                       'iceCorrection': str(iceCorrection), 'keepCells': int(keepCells)}
+
+    def _create(self):
+        f = netCDF4.Dataset(self.stateFile, 'w', format='NETCDF4')
+        try:
+            f.createDimension('Time', None)
+            f.createDimension('nCells', self.mesh.nCells)
+            f.createDimension('nDecades', None)
+            f.createDimension('nSlots', 2)
+            for name, value in self._attrs.items():
+                setattr(f, name, value)
+            f.fields = ' '.join(self.fields)
+            f.createVariable('yr', 'i4', ('Time',))
+            f.createVariable('mo', 'i4', ('Time',))
+            f.createVariable('time', 'f8', ('Time',)).units = 'years'
+            f.createVariable('decade', 'i4', ('nDecades',))
+            f.createVariable('nMonths', 'i4', ('nDecades', 'nSlots'))
+            for field in self.fields:
+                f.createVariable(field + '_mean', 'f8', ('Time',)).units = 'm'
+                f.createVariable(field + '_sum', 'f8', ('nDecades', 'nSlots', 'nCells'),
+                                 chunksizes=(1, 1, self.mesh.nCells))
+                if self.keepCells:
+                    # one record per chunk, so appending a month only touches its own chunks
+                    f.createVariable(field, 'f8', ('Time', 'nCells'), zlib=True,
+                                     chunksizes=(1, self.mesh.nCells)).units = 'm'
+        finally:
+            f.close()
+
+    def _open(self, mode='r'):
+        if not os.path.exists(self.stateFile):
+            if mode == 'r':
+                raise IOError('No state file {}'.format(self.stateFile))
+            self._create()
+        f = netCDF4.Dataset(self.stateFile, mode)
+        for name, value in list(self._attrs.items()) + [('fields', ' '.join(self.fields))]:
+            stored = getattr(f, name)
+            if stored != value:
+                f.close()
+                raise ValueError('{} was made with {}={}, not {}'.format(self.stateFile, name, stored, value))
+        return f
+
+    def _committed(self, f):
+        '''
+        Number of records that are complete and counted in the decade sums
+        (only the last record can be incomplete, if an update was killed),
+        the list of decades and, for each, the slot in use and its count.
+        '''
+        yr = f.variables['yr'][:]
+        invalid = np.nonzero(np.ma.getmaskarray(yr))[0]
+        nRecords = invalid[0] if len(invalid) > 0 else len(yr)
+        decades = f.variables['decade'][:].tolist()
+        # slots never committed hold the fill value: count them as -1
+        nMonths = np.ma.filled(f.variables['nMonths'][:], -1).reshape(len(decades), 2)
+        slots = [int(np.argmax(counts)) for counts in nMonths]
+        counts = [max(int(counts[slot]), 0) for counts, slot in zip(nMonths, slots)]
+        if nRecords > 0:
+            recordDecades = (np.ma.getdata(yr[:nRecords]) // 10 * 10).tolist()
+            last = recordDecades[-1]
+            summed = counts[decades.index(last)] if last in decades else 0
+            if recordDecades.count(last) > summed:
+                # killed after the record was written but before its month was summed
+                nRecords -= 1
+        return nRecords, decades, slots, counts
+
+    def processed(self):
+        '''Set of (yr, mo) already in the state file.'''
+        if not os.path.exists(self.stateFile):
+            return set()
+        f = self._open()
+        try:
+            nRecords = self._committed(f)[0]
+            return set(zip(f.variables['yr'][:nRecords].tolist(), f.variables['mo'][:nRecords].tolist()))
+        finally:
+            f.close()
+
+    def _write_record(self, f, n, yr, mo, values, means):
+        for field in self.fields:
+            f.variables[field + '_mean'][n] = means[field]
+            if self.keepCells:
+                f.variables[field][n, :] = values[field]
+        f.variables['time'][n] = decimal_year(yr, mo)
+        f.variables['mo'][n] = mo
+        # yr last: a record with yr set is complete
+        f.variables['yr'][n] = yr
+
+    def _add_to_sums(self, f, d, slot, count, values):
+        '''Write the sums plus values to the other slot of decade d, then make it the one in use.'''
+        new = 1 - slot
+        for field in self.fields:
+            old = np.ma.getdata(f.variables[field + '_sum'][d, slot, :]) if count > 0 else 0.0
+            f.variables[field + '_sum'][d, new, :] = old + values[field]
+        f.variables['nMonths'][d, new] = count + 1
+        return new, count + 1
+
+    def update(self, files):
+        '''
+        Process the files (as from monthly_files()) that are not in the state
+        file yet and append them.  Returns the number of new months.
+        '''
+        done = self.processed()
+        new = [(yr, mo, filename) for yr, mo, filename in files if (yr, mo) not in done]
+        if len(new) == 0:
+            return 0
+        areaCell = np.ma.getdata(self.mesh.areaCell)
+        areaTotal = areaCell.sum()
+        results = map_steric([filename for _, _, filename in new], self.mesh.maxLevelCell, self.mesh.bottomDepth,
+                             self.rho_ref, nProcs=min(self.nProcs or len(new), len(new)),
+                             iceCorrection=self.iceCorrection, chunkSize=self.chunkSize)
+        f = self._open('a')
+        try:
+            # records after the committed ones are left from a killed update: write over them
+            n, decades, slots, counts = self._committed(f)
+            for (yr, mo, _), result in zip(new, results):
+                values = dict(zip(stericFields, result))
+                means = dict((field, (values[field] * areaCell).sum() / areaTotal) for field in self.fields)
+                decade = yr // 10 * 10
+                if decade not in decades:
+                    # no slot committed yet, so the decade has no months until step 3
+                    f.variables['decade'][len(decades)] = decade
+                    decades.append(decade)
+                    slots.append(1)
+                    counts.append(0)
+                d = decades.index(decade)
+                self._write_record(f, n, yr, mo, values, means)
+                slots[d], counts[d] = self._add_to_sums(f, d, slots[d], counts[d], values)
+                n += 1
+                # flush every month, so a long update that is killed keeps the months it has finished
+                f.sync()
+        finally:
+            f.close()
+        return len(new)
+
+    def series(self):
+        '''
+        Dict of 'time' and the '<field>_mean' global means (and the per-cell
+        fields, if kept) sorted in time.
+        '''
+        f = self._open()
+        try:
+            nRecords = self._committed(f)[0]
+            time = f.variables['time'][:nRecords]
+            order = np.argsort(time)
+            out = {'time': np.ma.getdata(time)[order]}
+            for field in self.fields:
+                out[field + '_mean'] = np.ma.getdata(f.variables[field + '_mean'][:nRecords])[order]
+                if self.keepCells:
+                    out[field] = np.ma.getdata(f.variables[field][:nRecords])[order]
+        finally:
+            f.close()
+        return out
+
+    def decadal_means(self, complete=True):
+        '''
+        OrderedDict of decade -> {field: (nCells,) mean, 'nMonths': n}, in
+        time order.  With complete=True only decades with all 120 months are
+        included.
+        '''
+        f = self._open()
+        try:
+            _, decades, slots, nMonths = self._committed(f)
+            out = OrderedDict()
+            for d in np.argsort(decades):
+                if nMonths[d] == 0 or (complete and nMonths[d] < 120):
+                    continue
+                means = {'nMonths': nMonths[d]}
+                for field in self.fields:
+                    means[field] = np.ma.getdata(f.variables[field + '_sum'][d, slots[d], :]) / nMonths[d]
+                out[decades[d]] = means
+        finally:
+            f.close()
+        return out
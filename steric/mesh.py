@@ -0,0 +1,143 @@
+'''
+MPAS-Ocean mesh with lazily loaded fields and a local on-disk cache.
+
+Fields are only read from the mesh file the first time they are used.  Each
+field read is also saved as a .npy file in a local cache directory keyed on
+the mesh file's path, size and modification time, and later loads memory-map
+that copy instead of going back to the (often shared, slow) file system.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import hashlib
+
+import numpy as np
+import netCDF4
+
+from .column import level_mask
+from .profiling import profiler
+
+
+def default_cache_dir():
+    '''Cache location: $STERIC_CACHE_DIR, or ~/.cache/steric.'''
+    return os.environ.get('STERIC_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'steric'))
+
+
+def file_key(filename):
+    '''Short hash identifying a file by absolute path, size and mtime.'''
+    st = os.stat(filename)
+    ident = '{}|{}|{}'.format(os.path.abspath(filename), st.st_size, int(st.st_mtime * 1e9))
+    return hashlib.sha1(ident.encode('utf-8')).hexdigest()[:16]
+
+
+class Mesh(object):
+    '''
+    Lazily loaded MPAS mesh.  Any variable in the mesh file is available as an
+    attribute, e.g. mesh.latCell or mesh.maxLevelCell, and is read (or
+    memory-mapped from the cache) on first access.  Set cacheDir=False to
+    turn off the on-disk cache.
+    '''
+
+    def __init__(self, filename, cacheDir=None):
+        self.filename = filename
+        if cacheDir is None:
+            cacheDir = default_cache_dir()
+        if cacheDir:
+            base = os.path.splitext(os.path.basename(filename))[0]
+            self.cacheDir = os.path.join(cacheDir, 'mesh', '{}-{}'.format(base, file_key(filename)))
+        else:
+            self.cacheDir = None
+        self._fields = {}
+
+    def __getattr__(self, name):
+        # only called for attributes that are not already set
+        if name.startswith('_'):
+            raise AttributeError(name)
+        fields = self.__dict__.get('_fields')
+        if fields is None:
+            raise AttributeError(name)
+        if name not in fields:
+            fields[name] = self._load(name)
+        return fields[name]
+
+    def _cache_path(self, name):
+        return os.path.join(self.cacheDir, name + '.npy')
+
+    def _load(self, name):
+        if self.cacheDir is not None and os.path.exists(self._cache_path(name)):
+            with profiler.stage('mesh'):
+                return np.load(self._cache_path(name), mmap_mode='r')
+
+        with profiler.stage('mesh'):
+            f = netCDF4.Dataset(self.filename, 'r')
+            try:
+                if name not in f.variables:
+                    raise AttributeError('{} has no variable {}'.format(self.filename, name))
+                data = np.ma.getdata(f.variables[name][:])
+            finally:
+                f.close()
+            profiler.add_bytes(data.nbytes)
+
+        if self.cacheDir is not None:
+            self._save(name, data)
+            if os.path.exists(self._cache_path(name)):
+                return np.load(self._cache_path(name), mmap_mode='r')
+        return data
+
+    def cached(self, name, compute):
+        '''
+        Return a derived array (region masks, remap indices, ...) called name,
+        from the mesh cache if it is there, otherwise from compute() which is
+        then saved in the cache for next time.
+        '''
+        if name in self._fields:
+            return self._fields[name]
+        path = self._cache_path(name) if self.cacheDir is not None else None
+        if path is not None and os.path.exists(path):
+            data = np.load(path, mmap_mode='r')
+        else:
+            data = np.asarray(compute())
+            if path is not None:
+                self._save(name, data)
+        self._fields[name] = data
+        return data
+
+    def _save(self, name, data):
+        try:
+            if not os.path.isdir(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            # write to a temporary name first so other processes never see a partial file
+            tmp = '{}.{}.tmp.npy'.format(self._cache_path(name)[:-4], os.getpid())
+            np.save(tmp, data)
+            os.rename(tmp, self._cache_path(name))
+        except (IOError, OSError):
+            # an unwritable cache is not fatal, just slower next time
+            pass
+
+    @property
+    def nCells(self):
+        return len(self.maxLevelCell)
+
+    @property
+    def nVertLevels(self):
+        return len(self.refBottomDepth)
+
+    @property
+    def levelMask(self):
+        '''Boolean (nCells, nVertLevels) mask of active levels, built once.'''
+        if 'levelMask' not in self._fields:
+            self._fields['levelMask'] = level_mask(self.maxLevelCell, self.nVertLevels)
+        return self._fields['levelMask']
+
+    def work_buffer(self, chunkSize=None):
+        '''
+        (chunkSize or nCells, nVertLevels) float64 work array for
+        column_steric(), allocated once per mesh and size and then reused.
+        '''
+        nRows = min(chunkSize or self.nCells, self.nCells)
+        key = ('work', nRows)
+        if key not in self._fields:
+            self._fields[key] = np.empty((nRows, self.nVertLevels))
+        return self._fields[key]
@@ -0,0 +1,125 @@
+'''
+Per-level cumulative steric profiles.
+
+SL() reduces each column to one number.  The cumulative integral
+-1/rho_ref * sum(rho * h) down to every level interface (cumulative_steric())
+shows where in the water column a steric change between two periods builds
+up.  The full (nCells, nVertLevelsP1) field is large, so it is computed a
+block of cells at a time and written to a chunked, compressed netCDF file
+that can be read back by depth range or by region without loading the whole
+3D field.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import netCDF4
+
+from .column import cell_blocks, read_steric_vars, cumulative_steric
+from .profiling import profiler
+
+profileVar = 'stericProfile'
+fillValue = -9.99999979e+33  # MPAS _FillValue
+
+# chunks of (cells, interfaces): small enough along the levels that a few
+# depths can be read without the rest, large enough along cells for maps
+defaultChunks = (65536, 8)
+
+
+def write_steric_profiles(filename, files, mesh, rho_ref, referenceFile=None, chunkSize=None,
+                          chunks=defaultChunks, times=None):
+    '''
+    Write the cumulative steric profile of each of files (names of
+    timeSeriesStatsMonthly-like output) to filename as
+    stericProfile(Time, nCells, nVertLevelsP1), in m.
+
+    With referenceFile, the profile of that file is subtracted, so each
+    record is the cumulative steric change since the reference period.
+    times (e.g. decimal years) are written to the Time variable if given.
+    The files are opened one at a time, once per block of chunkSize cells,
+    so any number of them can be written.
+    '''
+    nCells = mesh.nCells
+    nVertLevels = mesh.nVertLevels
+    levelMask = mesh.levelMask
+    refInterfaces = np.concatenate(([0.0], np.asarray(mesh.refBottomDepth)))
+    chunks = (1, min(chunks[0], nCells), min(chunks[1], nVertLevels + 1))
+
+    ref = netCDF4.Dataset(referenceFile, 'r') if referenceFile is not None else None
+    out = netCDF4.Dataset(filename, 'w', format='NETCDF4')
+    try:
+        out.createDimension('Time', None)
+        out.createDimension('nCells', nCells)
+        out.createDimension('nVertLevelsP1', nVertLevels + 1)
+        out.rho_ref = float(rho_ref)
+        out.source_files = ' '.join(files)
+        if referenceFile is not None:
+            out.reference_file = referenceFile
+        var = out.createVariable('refInterfaceDepth', 'f8', ('nVertLevelsP1',))
+        var.units = 'm'
+        var.long_name = 'reference depth of each level interface, positive down'
+        var[:] = refInterfaces
+        if times is not None:
+            out.createVariable('time', 'f8', ('Time',))[:] = times
+        var = out.createVariable(profileVar, 'f8', ('Time', 'nCells', 'nVertLevelsP1'), zlib=True,
+                                 chunksizes=chunks, fill_value=fillValue)
+        var.units = 'm'
+        var.long_name = ('cumulative steric height -1/rho_ref * sum(rho h) from the surface to each interface'
+                         + ('' if referenceFile is None else ', minus that of the reference file'))
+
+        block = np.empty((min(chunkSize or nCells, nCells), nVertLevels + 1))
+        refBlock = np.empty(block.shape) if ref is not None else None
+        for cells in cell_blocks(nCells, chunkSize):
+            n = cells.stop - cells.start
+            mask = levelMask[cells]
+            if ref is not None:
+                rho, layerThickness, _, _ = read_steric_vars(ref, cells, masked=False)
+                with profiler.stage('integrate'):
+                    cumulative_steric(rho, layerThickness, mask, rho_ref, out=refBlock[:n])
+            # one file open at a time: a monthly series can be more files than may be open at once
+            for t, name in enumerate(files):
+                f = netCDF4.Dataset(name, 'r')
+                try:
+                    rho, layerThickness, _, _ = read_steric_vars(f, cells, masked=False)
+                finally:
+                    f.close()
+                with profiler.stage('integrate'):
+                    profile = cumulative_steric(rho, layerThickness, mask, rho_ref, out=block[:n])
+                    if ref is not None:
+                        profile -= refBlock[:n]
+                var[t, cells, :] = np.where(np.isnan(profile), fillValue, profile)
+    finally:
+        out.close()
+        if ref is not None:
+            ref.close()
+    return filename
+
+
+def read_steric_profile(filename, time=0, cells=slice(None), depthRange=None):
+    '''
+    Read part of a file from write_steric_profiles(): one Time record, the
+    given cells (a slice, or indices such as Regions.cells()) and optionally
+    only the interfaces with depthRange[0] <= depth <= depthRange[1].
+    Returns (depths, profile) with profile a masked (nCells, nInterfaces)
+    array.
+    '''
+    f = netCDF4.Dataset(filename, 'r')
+    try:
+        depths = f.variables['refInterfaceDepth'][:]
+        levels = slice(None)
+        if depthRange is not None:
+            inRange = np.nonzero((depths >= depthRange[0]) & (depths <= depthRange[1]))[0]
+            if len(inRange) == 0:
+                raise ValueError('No interfaces in {} between {} and {} m; they span {} to {} m'.format(
+                    filename, depthRange[0], depthRange[1], depths.min(), depths.max()))
+            levels = slice(inRange[0], inRange[-1] + 1)
+        var = f.variables[profileVar]
+        if isinstance(cells, slice):
+            profile = var[time, cells, levels]
+        else:
+            # read the bounding hyperslab, then select, rather than a slow point-wise read
+            cells = np.asarray(cells)
+            profile = var[time, cells.min():cells.max() + 1, levels][cells - cells.min()]
+        return depths[levels], profile
+    finally:
+        f.close()
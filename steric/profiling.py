@@ -0,0 +1,144 @@
+'''
+Stage-level timing and memory instrumentation.
+
+The steric code marks its stages with profiler.stage(name):
+  mesh       : reading mesh fields (or memory-mapping them from the cache)
+  read       : reading the variables of an output file
+  integrate  : the vertical integrals (column_steric(), depth_steric())
+  drift      : drift fits
+  reduce     : regional and global means
+  render     : drawing map panels
+For every stage the number of calls, wall time, bytes decoded and memory
+are kept.  Bytes decoded are the sizes of the arrays the reads returned,
+not the bytes read from disk, which for compressed files are fewer.
+Memory is the process's peak RSS when the stage ended, and the largest
+increase of that peak during one call, i.e. how much a stage raised the
+high-water mark.  Stages that run inside worker processes are merged
+back into the parent's profiler.
+
+Nothing is recorded until the profiler is enabled, with profiler.enable() or
+by setting STERIC_PROFILE to the name of a JSON report, which is then
+written (and a summary printed) when the program exits.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import sys
+import time
+import json
+import atexit
+import platform
+import contextlib
+from collections import OrderedDict
+
+
+def max_rss(children=False):
+    '''
+    Peak resident set size of this process so far, in bytes (Linux reports
+    kB).  With children=True, the largest peak of any child process that has
+    finished and been waited for, e.g. pool workers after the pool is joined.
+    '''
+    import resource
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return resource.getrusage(who).ru_maxrss * 1024
+
+
+def _new_record():
+    return OrderedDict([('calls', 0), ('seconds', 0.0), ('bytesDecoded', 0), ('maxRSS', 0), ('peakIncrease', 0)])
+
+
+class Profiler(object):
+    '''
+    Per-stage wall time, bytes decoded and memory.  Nested stages are each
+    timed in full, so the time of an inner stage is also part of the outer.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        '''Forget everything recorded so far.'''
+        self.stages = OrderedDict()
+        self._active = []
+        self.started = time.time()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''Context manager timing one call of stage name.'''
+        if not self.enabled:
+            yield
+            return
+        record = self.stages.setdefault(name, _new_record())
+        self._active.append(record)
+        rss0 = max_rss()
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - t0
+            rss1 = max_rss()
+            self._active.pop()
+            record['calls'] += 1
+            record['seconds'] += seconds
+            record['maxRSS'] = max(record['maxRSS'], rss1)
+            record['peakIncrease'] = max(record['peakIncrease'], rss1 - rss0)
+
+    def add_bytes(self, nbytes):
+        '''Count nbytes of decoded data (e.g. an array just read) for the innermost active stage.'''
+        if self.enabled and self._active:
+            self._active[-1]['bytesDecoded'] += int(nbytes)
+
+    def merge(self, stages):
+        '''Add stages recorded by another process (e.g. a pool worker).'''
+        for name, other in stages.items():
+            record = self.stages.setdefault(name, _new_record())
+            for key in ('calls', 'seconds', 'bytesDecoded'):
+                record[key] += other[key]
+            for key in ('maxRSS', 'peakIncrease'):
+                record[key] = max(record[key], other[key])
+
+    def report(self, **info):
+        '''Dict of everything recorded, with info added, ready for JSON.'''
+        out = OrderedDict([('host', platform.node()),
+                           ('nCPUs', os.cpu_count() if hasattr(os, 'cpu_count') else None),
+                           ('command', ' '.join(sys.argv)),
+                           ('started', time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started))),
+                           ('wallSeconds', time.time() - self.started),
+                           ('maxRSS', max_rss())])
+        out.update(info)
+        out['stages'] = self.stages
+        return out
+
+    def summary(self):
+        '''Table of the stages as a string.'''
+        lines = ['{:>10} {:>7} {:>10} {:>11} {:>11} {:>11}'.format(
+            'stage', 'calls', 'seconds', 'MB decoded', 'max RSS MB', 'peak +MB')]
+        for name, record in self.stages.items():
+            lines.append('{:>10} {:>7d} {:>10.3f} {:>11.1f} {:>11.1f} {:>11.1f}'.format(
+                name, record['calls'], record['seconds'], record['bytesDecoded'] / 1024.0**2,
+                record['maxRSS'] / 1024.0**2, record['peakIncrease'] / 1024.0**2))
+        lines.append('total wall time {:.3f} s'.format(time.time() - self.started))
+        return '\n'.join(lines)
+
+    def write_json(self, filename, **info):
+        '''Write report(**info) to filename.'''
+        with open(filename, 'w') as f:
+            json.dump(self.report(**info), f, indent=2)
+
+
+profiler = Profiler()
+
+
+def _report_at_exit(filename):
+    print(profiler.summary())
+    profiler.write_json(filename)
+
+
+if os.environ.get('STERIC_PROFILE'):
+    profiler.enable()
+    atexit.register(_report_at_exit, os.environ['STERIC_PROFILE'])
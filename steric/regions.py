@@ -0,0 +1,155 @@
+'''
+Named regions of the mesh and area-weighted regional means.
+
+Regions are defined once as unions of lat/lon boxes (in degrees) instead of
+rebuilding idx = np.nonzero(...) before every figure.  The cell masks are
+cached with the mesh, and all regions together give a sparse
+(nRegions, nCells) weight matrix, so the area-weighted means of many regions
+over many time steps come out of one sparse matrix product.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .column import cell_ranges
+from .profiling import profiler
+
+# Each region is a list of (latMin, latMax, lonMin, lonMax) boxes in degrees,
+# lon in [0, 360).  Bounds are strict inequalities and None means unbounded.
+regionBoxes = OrderedDict([
+    ('global', [(None, None, None, None)]),
+    ('SO', [(None, -50.0, None, None)]),
+    ('Weddell', [(-85.0, -70.0, 300.0, 350.0)]),
+    ('WeddellWide', [(-85.0, -70.0, 270.0, 350.0)]),
+    ('WeddellToAmery', [(-85.0, -60.0, 280.0, None), (-85.0, -60.0, None, 80.0)]),
+])
+
+
+def add_region(name, boxes):
+    '''Add (or replace) a region made of a list of (latMin, latMax, lonMin, lonMax) boxes.'''
+    regionBoxes[name] = list(boxes)
+
+
+def box_mask(latCell, lonCell, boxes):
+    '''Boolean mask of cells (lat/lon in radians) inside any of the boxes.'''
+    lat = np.degrees(latCell)
+    lon = np.degrees(lonCell)
+    mask = np.zeros(lat.shape, dtype=bool)
+    for latMin, latMax, lonMin, lonMax in boxes:
+        inBox = np.ones(lat.shape, dtype=bool)
+        if latMin is not None:
+            inBox &= lat > latMin
+        if latMax is not None:
+            inBox &= lat < latMax
+        if lonMin is not None:
+            inBox &= lon > lonMin
+        if lonMax is not None:
+            inBox &= lon < lonMax
+        mask |= inBox
+    return mask
+
+
+def morton_order(latCell, lonCell, bits=16):
+    '''
+    Permutation of the cells that sorts them along a Z-order (Morton) curve
+    in lat/lon, so that cells close together on the globe end up close
+    together in the order, and a region is covered by few contiguous ranges.
+    '''
+    lat = np.asarray(latCell)
+    lon = np.mod(np.asarray(lonCell), 2.0 * np.pi)
+    scale = 2**bits - 1
+    i = np.round((lat + 0.5 * np.pi) / np.pi * scale).astype(np.uint64)
+    j = np.round(lon / (2.0 * np.pi) * scale).astype(np.uint64)
+    key = np.zeros(lat.shape, dtype=np.uint64)
+    for b in range(bits):
+        bit = np.uint64(b)
+        key |= ((i >> bit) & np.uint64(1)) << np.uint64(2 * b + 1)
+        key |= ((j >> bit) & np.uint64(1)) << np.uint64(2 * b)
+    return np.argsort(key, kind='mergesort')
+
+
+class Regions(object):
+    '''
+    Region masks for a Mesh.  Masks for the boxes in regionBoxes are cached
+    with the mesh, keyed on the box definition so editing a region is safe.
+    Other masks (e.g. from an MPAS region mask file) can be added with add().
+    '''
+
+    def __init__(self, mesh, names=None):
+        self.mesh = mesh
+        self.names = list(regionBoxes.keys() if names is None else names)
+        self._masks = {}
+        self._weights = None
+
+    def add(self, name, mask):
+        '''Add a region from a boolean (nCells,) mask.'''
+        self._masks[name] = np.asarray(mask, dtype=bool)
+        if name not in self.names:
+            self.names.append(name)
+        self._weights = None
+
+    def mask(self, name):
+        '''Boolean (nCells,) mask of the cells in region name.'''
+        if name not in self._masks:
+            boxes = regionBoxes[name]
+            key = hashlib.sha1(repr(boxes).encode('utf-8')).hexdigest()[:8]
+            self._masks[name] = self.mesh.cached(
+                'region-{}-{}'.format(name, key),
+                lambda: box_mask(self.mesh.latCell, self.mesh.lonCell, boxes))
+        return self._masks[name]
+
+    def cells(self, name):
+        '''Cell indices of region name, i.e. the idx used in the scripts.'''
+        return np.nonzero(self.mask(name))[0]
+
+    def ranges(self, name, maxGap=None):
+        '''Contiguous nCells slices covering region name, for hyperslab reads (see cell_ranges()).'''
+        return cell_ranges(self.cells(name), maxGap)
+
+    def weights(self):
+        '''
+        Sparse (nRegions, nCells) matrix of area weights normalized to sum to
+        one in each row, in the order of self.names.
+        '''
+        if self._weights is None:
+            import scipy.sparse
+            areaCell = np.ma.getdata(self.mesh.areaCell)
+            rows = []
+            cols = []
+            vals = []
+            for r, name in enumerate(self.names):
+                cells = self.cells(name)
+                area = areaCell[cells]
+                if len(cells) == 0:
+                    continue
+                rows.append(np.full(len(cells), r))
+                cols.append(cells)
+                vals.append(area / area.sum())
+            self._weights = scipy.sparse.csr_matrix(
+                (np.concatenate(vals or [[]]), (np.concatenate(rows or [[]]), np.concatenate(cols or [[]]))),
+                shape=(len(self.names), len(areaCell)))
+        return self._weights
+
+    def mean(self, field):
+        '''
+        Area-weighted mean of field over every region.  field is (nCells,) or
+        (nTimes, nCells); the result is (nRegions,) or (nRegions, nTimes).
+        '''
+        weights = self.weights()
+        with profiler.stage('reduce'):
+            field = np.ma.getdata(field)
+            if field.ndim == 1:
+                means = weights.dot(field)
+            else:
+                means = weights.dot(field.T)
+            # regions with no cells on this mesh have no mean
+            means[np.asarray(weights.sum(axis=1)).ravel() == 0] = np.nan
+        return means
+
+    def means(self, field):
+        '''Like mean() but returned as an OrderedDict keyed on region name.'''
+        return OrderedDict(zip(self.names, self.mean(field)))
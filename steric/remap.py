@@ -0,0 +1,116 @@
+'''
+Nearest-neighbour remapping of cell fields to regular grids for fast maps.
+
+Scattering ~235k points per panel is slow to draw.  Instead each panel can be
+drawn as an image on a regular grid: the nearest cell to every grid point is
+found once per mesh, region and grid, cached with the mesh, and every later
+panel is just an index gather.
+
+Two views match the scatter plots in the scripts:
+  'latlon' : lonCell (x) vs latCell (y) in radians, gridded at resolution degrees
+  'xy'     : yCell (x) vs xCell (y) in m, the Antarctic views, gridded at resolution m
+Grid points farther than about one cell width from any selected cell (land,
+or outside the region) are left blank.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import hashlib
+
+import numpy as np
+
+from .profiling import profiler
+
+defaultResolution = {'latlon': 0.5, 'xy': 25.0e3}
+sphereRadius = 6371229.0  # m, MPAS default
+
+# grid points are blank if the nearest cell is farther than this many cell widths
+maxDistanceFactor = 1.0
+
+
+def _view_coords(mesh, cells, view):
+    '''Horizontal and vertical plot coordinates of cells for a view.'''
+    if view == 'latlon':
+        return np.asarray(mesh.lonCell)[cells], np.asarray(mesh.latCell)[cells]
+    elif view == 'xy':
+        return np.asarray(mesh.yCell)[cells], np.asarray(mesh.xCell)[cells]
+    raise ValueError('Unknown view: {}'.format(view))
+
+
+def _unit_xyz(lon, lat):
+    return np.stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=-1)
+
+
+def grid_axes(mesh, cells, view='latlon', resolution=None):
+    '''
+    1D horizontal and vertical grid point coordinates covering the bounding
+    box of the cells, in the units of the view (radians or m).
+    '''
+    if resolution is None:
+        resolution = defaultResolution[view]
+    step = np.radians(resolution) if view == 'latlon' else resolution
+    h, v = _view_coords(mesh, cells, view)
+    hGrid = np.arange(h.min() + 0.5 * step, h.max(), step)
+    vGrid = np.arange(v.min() + 0.5 * step, v.max(), step)
+    return hGrid, vGrid
+
+
+def _nearest(mesh, cells, view, hGrid, vGrid):
+    from scipy.spatial import cKDTree
+
+    h, v = _view_coords(mesh, cells, view)
+    H, V = np.meshgrid(hGrid, vGrid)
+    if view == 'latlon':
+        # search on the sphere so the dateline and poles are handled properly
+        tree = cKDTree(sphereRadius * _unit_xyz(h, v))
+        dist, ind = tree.query(sphereRadius * _unit_xyz(H.ravel(), V.ravel()))
+    else:
+        tree = cKDTree(np.stack((h, v), axis=-1))
+        dist, ind = tree.query(np.stack((H.ravel(), V.ravel()), axis=-1))
+    width = np.sqrt(np.asarray(mesh.areaCell)[cells])
+    ind[dist > maxDistanceFactor * width[ind]] = -1
+    return ind.reshape(H.shape)
+
+
+def remap_indices(mesh, cells, view='latlon', resolution=None):
+    '''
+    (ny, nx) array giving, for every grid point, the position in cells of the
+    nearest cell, or -1 where the point is blank.  Cached with the mesh.
+    '''
+    cells = np.asarray(cells, dtype=np.int64)
+    if resolution is None:
+        resolution = defaultResolution[view]
+    key = hashlib.sha1(cells.tobytes()).hexdigest()[:12]
+    hGrid, vGrid = grid_axes(mesh, cells, view, resolution)
+    return mesh.cached('remap-{}-{}-{}'.format(view, resolution, key),
+                       lambda: _nearest(mesh, cells, view, hGrid, vGrid))
+
+
+def remap(values, indices):
+    '''Gather values (one per selected cell) onto the grid as a masked array.'''
+    values = np.ma.getdata(values)
+    return np.ma.masked_array(values[np.maximum(indices, 0)], mask=(indices < 0))
+
+
+def plot_cells(mesh, cells, values, view='latlon', image=True, resolution=None, s=1, **kwargs):
+    '''
+    Draw values at cells on the current axes.  With image=True the field is
+    remapped to a regular grid and drawn with imshow; otherwise this is the
+    original plt.scatter of every cell.  Other keyword arguments (vmin, vmax,
+    cmap, ...) are passed to imshow or scatter.  Returns the mappable, so
+    plt.colorbar() works the same either way.
+    '''
+    import matplotlib.pyplot as plt
+
+    with profiler.stage('render'):
+        if not image:
+            h, v = _view_coords(mesh, cells, view)
+            return plt.scatter(h, v, s=s, c=values, **kwargs)
+
+        indices = remap_indices(mesh, cells, view, resolution)
+        hGrid, vGrid = grid_axes(mesh, cells, view, resolution)
+        dh = 0.5 * (hGrid[1] - hGrid[0]) if len(hGrid) > 1 else 0.5
+        dv = 0.5 * (vGrid[1] - vGrid[0]) if len(vGrid) > 1 else 0.5
+        extent = (hGrid[0] - dh, hGrid[-1] + dh, vGrid[0] - dv, vGrid[-1] + dv)
+        return plt.imshow(remap(values, indices), origin='lower', extent=extent,
+                          interpolation='nearest', aspect='auto', **kwargs)
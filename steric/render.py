@@ -0,0 +1,124 @@
+'''
+Headless, parallel rendering of map figures to files.
+
+Figures are described declaratively, as a Figure (output file and layout) of
+Panels (field, region, view, colormap, limits, title), and drawn with the
+Agg backend in a pool of worker processes, one figure per task.  The remap
+indices every panel needs are computed once in the parent first, so the
+workers only gather values and draw, and a whole set of figures takes about
+as long as the slowest one.  A figure is one task, not a panel, because
+the panels of a figure share one matplotlib figure and file.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import multiprocessing
+
+import numpy as np
+
+from .regions import Regions
+from .remap import remap_indices, plot_cells
+
+
+class Panel(object):
+    '''
+    One map: fields[field] (all cells) times scale over the cells of region,
+    drawn in view ('latlon' or 'xy').  With demean=True the mean over the
+    region is subtracted first, the plain mean of the cell values as in the
+    scripts' demeaned plots; demean='area' subtracts the area-weighted mean
+    instead.
+    '''
+
+    def __init__(self, field, region='global', view='latlon', cmap='RdBu_r', vmin=None, vmax=None, title=None,
+                 scale=1.0, demean=False):
+        self.field = field
+        self.region = region
+        self.view = view
+        self.cmap = cmap
+        self.vmin = vmin
+        self.vmax = vmax
+        self.title = title if title is not None else field
+        self.scale = scale
+        self.demean = demean
+
+
+class Figure(object):
+    '''Panels drawn on a grid of ncol columns and saved to filename (.png, .pdf, ...).'''
+
+    def __init__(self, filename, panels, ncol=None, figsize=(14, 6), dpi=150):
+        self.filename = filename
+        self.panels = list(panels)
+        self.ncol = ncol if ncol is not None else min(len(self.panels), 2)
+        self.figsize = figsize
+        self.dpi = dpi
+
+
+# Mesh, fields and settings for the worker processes, set by the pool initializer.
+_worker = {}
+
+
+def _init_worker(mesh, fields, image):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    # in case the parent had already picked an interactive backend
+    plt.switch_backend('Agg')
+    _worker['mesh'] = mesh
+    _worker['regions'] = Regions(mesh)
+    _worker['fields'] = fields
+    _worker['image'] = image
+
+
+def _render_figure(figure):
+    import matplotlib.pyplot as plt
+
+    mesh = _worker['mesh']
+    regions = _worker['regions']
+    nrow = (len(figure.panels) + figure.ncol - 1) // figure.ncol
+    fig = plt.figure(facecolor='w', figsize=figure.figsize)
+    try:
+        for n, panel in enumerate(figure.panels):
+            ax = fig.add_subplot(nrow, figure.ncol, n + 1)
+            cells = regions.cells(panel.region)
+            values = np.ma.getdata(_worker['fields'][panel.field])[cells] * panel.scale
+            if panel.demean == 'area':
+                areaCell = np.ma.getdata(mesh.areaCell)[cells]
+                values = values - (values * areaCell).sum() / areaCell.sum()
+            elif panel.demean:
+                values = values - values.mean()
+            plot_cells(mesh, cells, values, panel.view, image=_worker['image'], vmin=panel.vmin, vmax=panel.vmax,
+                       cmap=panel.cmap)
+            if panel.view == 'xy':
+                # equal aspect with no axes, as the scripts draw x/y views; set_aspect rather
+                # than axis('equal') so the limits, and so the whole image, are kept
+                ax.set_aspect('equal'); plt.axis('off')
+            plt.colorbar()
+            plt.title(panel.title)
+        fig.savefig(figure.filename, dpi=figure.dpi)
+    finally:
+        plt.close(fig)
+    return figure.filename
+
+
+def render_figures(figures, mesh, fields, nProcs=None, image=True):
+    '''
+    Draw every Figure to its file with nProcs worker processes (default: all
+    cores, at most one per figure).  fields is a dict of (nCells,) arrays
+    named by the panels.  Returns the file names in order.
+    '''
+    figures = list(figures)
+    if len(figures) == 0:
+        return []
+    if image:
+        # fill the mesh cache before the workers start: forked workers inherit
+        # it, and with other start methods it is pickled with the mesh in initargs
+        regions = Regions(mesh)
+        for key in set((panel.region, panel.view) for figure in figures for panel in figure.panels):
+            remap_indices(mesh, regions.cells(key[0]), key[1])
+    pool = multiprocessing.Pool(min(nProcs or multiprocessing.cpu_count(), len(figures)),
+                                initializer=_init_worker, initargs=(mesh, fields, image))
+    try:
+        return pool.map(_render_figure, figures)
+    finally:
+        pool.terminate()
+        pool.join()
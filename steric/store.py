@@ -0,0 +1,145 @@
+'''
+Results store: computed fields in a chunked, compressed netCDF4 file.
+
+Fields are written with MPAS dimension names (Time, nCells, StrLen) and an
+xtime variable, with latCell, lonCell and areaCell copied from the mesh, so
+the file can be read like MPAS output by the usual tools.  When a Regions is
+given, every field also gets its area-weighted regional means as
+<field>_regionMean over nRegions, with the names in regionNames.
+
+Chunks serve both ways the results are read:
+  maps         : one time, all cells.  Per-cell series are chunked as
+                 (timeChunk, cellChunk) with timeChunk=1 by default, so a map
+                 reads and decompresses only its own record.
+  time series  : one region, all times.  These come from the small
+                 <field>_regionMean(Time, nRegions) variables, chunked as
+                 (regionTimeChunk, nRegions), so up to regionTimeChunk
+                 records are one chunk.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import netCDF4
+
+strLen = 64
+regionTimeChunk = 1024
+
+
+def mpas_xtime(yr, mo=1, day=1):
+    '''MPAS time stamp, e.g. (1900, 1) -> '1900-01-01_00:00:00'.'''
+    return '{:04d}-{:02d}-{:02d}_00:00:00'.format(yr, mo, day)
+
+
+def _chars(strings):
+    '''(len(strings), strLen) char array for an S1 variable.'''
+    out = np.zeros((len(strings), strLen), dtype='S1')
+    for n, string in enumerate(strings):
+        encoded = string.encode('utf-8')[:strLen]
+        out[n, :len(encoded)] = np.frombuffer(encoded, dtype='S1')
+    return out
+
+
+class ResultStore(object):
+    '''
+    Write steric results for mesh (and regional means for regions) to
+    filename.  mode='a' adds to an existing store.  Use as a context manager
+    or call close().
+    '''
+
+    def __init__(self, filename, mesh, regions=None, mode='w', timeChunk=1, cellChunk=65536, complevel=4):
+        self.filename = filename
+        self.mesh = mesh
+        self.regions = regions
+        self.timeChunk = timeChunk
+        self.cellChunk = min(cellChunk, mesh.nCells)
+        self.complevel = complevel
+        self.file = netCDF4.Dataset(filename, mode, format='NETCDF4')
+        if mode == 'w':
+            self._create()
+
+    def _create(self):
+        f = self.file
+        f.createDimension('Time', None)
+        f.createDimension('nCells', self.mesh.nCells)
+        f.createDimension('StrLen', strLen)
+        f.mesh_file = self.mesh.filename
+        f.source = 'steric sea level analysis'
+        f.createVariable('xtime', 'S1', ('Time', 'StrLen'))
+        for name, units, long_name in (('latCell', 'radians', 'latitude of cell centers'),
+                                       ('lonCell', 'radians', 'longitude of cell centers'),
+                                       ('areaCell', 'm^2', 'area of each cell')):
+            var = f.createVariable(name, 'f8', ('nCells',), zlib=True, complevel=self.complevel)
+            var.units = units
+            var.long_name = long_name
+            var[:] = np.ma.getdata(getattr(self.mesh, name))
+        if self.regions is not None:
+            f.createDimension('nRegions', len(self.regions.names))
+            var = f.createVariable('regionNames', 'S1', ('nRegions', 'StrLen'))
+            var[:] = _chars(self.regions.names)
+
+    def _xtime_index(self, xtime):
+        '''Time index of the record for xtime, appending a new record if needed.'''
+        var = self.file.variables['xtime']
+        existing = []
+        if len(self.file.dimensions['Time']) > 0:
+            existing = [str(stamp) for stamp in netCDF4.chartostring(var[:])]
+        if xtime in existing:
+            return existing.index(xtime)
+        n = len(existing)
+        var[n, :] = _chars([xtime])[0]
+        return n
+
+    def _variable(self, name, dims, units, long_name):
+        if name in self.file.variables:
+            return self.file.variables[name]
+        if dims == ('Time', 'nCells'):
+            chunks = (self.timeChunk, self.cellChunk)
+        elif dims == ('nCells',):
+            chunks = (self.cellChunk,)
+        elif dims == ('Time', 'nRegions'):
+            chunks = (regionTimeChunk, len(self.file.dimensions['nRegions']))
+        else:
+            chunks = None
+        var = self.file.createVariable(name, 'f8', dims, zlib=True, complevel=self.complevel, chunksizes=chunks)
+        var.units = units
+        if long_name is not None:
+            var.long_name = long_name
+        return var
+
+    def put(self, name, values, long_name=None, units='m', xtime=None):
+        '''
+        Write a field.  values is (nCells,) for a field with no time (e.g. a
+        drift or SLC rate), or one time record if xtime is given, or
+        (nTimes, nCells) with xtime a list of nTimes time stamps.
+        '''
+        values = np.ma.getdata(values)
+        if xtime is None:
+            self._variable(name, ('nCells',), units, long_name)[:] = values
+            if self.regions is not None:
+                self._variable(name + '_regionMean', ('nRegions',), units, long_name)[:] = self.regions.mean(values)
+            return
+        if np.ndim(xtime) == 0:
+            xtime = [xtime]
+            values = values[np.newaxis, :]
+        var = self._variable(name, ('Time', 'nCells'), units, long_name)
+        means = self.regions.mean(values) if self.regions is not None else None
+        for t, stamp in enumerate(xtime):
+            n = self._xtime_index(stamp)
+            var[n, :] = values[t]
+            if means is not None:
+                self._variable(name + '_regionMean', ('Time', 'nRegions'), units, long_name)[n, :] = means[:, t]
+
+    def append(self, xtime, long_names=None, units='m', **fields):
+        '''Write one time record of several fields, e.g. append(xtime, SL=SL, ht=ht).'''
+        for name, values in fields.items():
+            self.put(name, values, (long_names or {}).get(name), units, xtime)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
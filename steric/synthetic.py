@@ -0,0 +1,164 @@
+'''
+Synthetic MPAS-Ocean-shaped mesh and timeSeriesStatsMonthly files.
+
+These have the variables, dimensions, fill values and level structure the
+steric code reads (maxLevelCell, bottomDepth, density, layerThickness, ssh,
+pressureAdjustedSSH, ...), with plausible but made-up values, so the code can
+be run and timed without the real output.  Files are written a block of
+cells at a time, so even RRS18to6-sized files never need the whole 3D field
+in memory.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+import netCDF4
+
+from .column import cell_blocks
+from .timeseries import monthlyTemplate
+from .regions import morton_order
+
+# (nCells, nVertLevels), approximately those of the E3SM ocean meshes
+meshSizes = OrderedDict([
+    ('QU240', (7153, 16)),
+    ('QU120', (28571, 30)),
+    ('EC60to30', (235160, 60)),
+    ('RRS30to10', (1445361, 80)),
+    ('RRS18to6', (3693225, 80)),
+])
+
+fillValue = -9.99999979e+33  # MPAS _FillValue
+maxDepth = 6000.0  # m
+sphereRadius = 6371229.0  # m
+writeBlockSize = 100000
+
+
+def _ref_bottom_depth(nVertLevels):
+    '''Level bottoms from 10 m thick at the surface to about 250 m at 6000 m.'''
+    dz = np.linspace(1.0, 25.0, nVertLevels)
+    return np.cumsum(dz) * maxDepth / dz.sum()
+
+
+def write_mesh(filename, nCells, nVertLevels, seed=0, sortCells=False):
+    '''
+    Write a mesh file with nCells cells spread uniformly over the sphere and
+    random bathymetry.  Returns the filename.
+
+    With sortCells the cells are stored in locality (Morton) order, as mesh
+    generators tend to number them, rather than at random, so regions are
+    covered by few contiguous ranges (see cell_ranges()).
+    '''
+    rng = np.random.RandomState(seed)
+    latCell = np.arcsin(rng.uniform(-1.0, 1.0, nCells))
+    lonCell = rng.uniform(0.0, 2.0 * np.pi, nCells)
+    if sortCells:
+        order = morton_order(latCell, lonCell)
+        latCell = latCell[order]
+        lonCell = lonCell[order]
+    refBottomDepth = _ref_bottom_depth(nVertLevels)
+    # shelves, slopes and abyssal plains: more deep columns than shallow ones
+    bottomDepth = maxDepth * np.sqrt(rng.uniform(0.0025, 1.0, nCells))
+    maxLevelCell = np.minimum(np.searchsorted(refBottomDepth, bottomDepth) + 1, nVertLevels)
+    bottomDepth = np.minimum(bottomDepth, refBottomDepth[-1])
+
+    f = netCDF4.Dataset(filename, 'w')
+    try:
+        f.createDimension('nCells', nCells)
+        f.createDimension('nVertLevels', nVertLevels)
+        f.createVariable('refBottomDepth', 'f8', ('nVertLevels',))[:] = refBottomDepth
+        for name, values in (('latCell', latCell),
+                             ('lonCell', lonCell),
+                             ('xCell', sphereRadius * np.cos(latCell) * np.cos(lonCell)),
+                             ('yCell', sphereRadius * np.cos(latCell) * np.sin(lonCell)),
+                             ('zCell', sphereRadius * np.sin(latCell)),
+                             ('areaCell', np.full(nCells, 4.0 * np.pi * sphereRadius**2 / nCells)),
+                             ('bottomDepth', bottomDepth)):
+            f.createVariable(name, 'f8', ('nCells',))[:] = values
+        f.createVariable('maxLevelCell', 'i4', ('nCells',))[:] = maxLevelCell
+    finally:
+        f.close()
+    return filename
+
+
+def write_output(filename, mesh, seed=0, warming=0.0, tracers=False):
+    '''
+    Write one timeSeriesStatsMonthly-like file for mesh (a Mesh of a file
+    from write_mesh()).  warming (degC) lowers the density of the upper ocean
+    to give a steric signal between files.  With tracers=True temperature and
+    salinity are written too.  Inactive levels hold the MPAS fill value.
+    '''
+    rng = np.random.RandomState(seed)
+    nCells = mesh.nCells
+    nVertLevels = mesh.nVertLevels
+    refBottomDepth = np.asarray(mesh.refBottomDepth)
+    refThickness = np.diff(np.concatenate(([0.0], refBottomDepth)))
+    refMid = refBottomDepth - 0.5 * refThickness
+
+    f = netCDF4.Dataset(filename, 'w')
+    try:
+        f.createDimension('Time', None)
+        f.createDimension('nCells', nCells)
+        f.createDimension('nVertLevels', nVertLevels)
+        names = ['density', 'layerThickness']
+        if tracers:
+            names += ['activeTracers_temperature', 'activeTracers_salinity']
+        var3d = dict((name, f.createVariable('timeMonthly_avg_' + name, 'f8', ('Time', 'nCells', 'nVertLevels'),
+                                             fill_value=fillValue))
+                     for name in names)
+        var2d = dict((name, f.createVariable('timeMonthly_avg_' + name, 'f8', ('Time', 'nCells')))
+                     for name in ('ssh', 'pressureAdjustedSSH'))
+
+        for cells in cell_blocks(nCells, writeBlockSize):
+            n = cells.stop - cells.start
+            maxLevelCell = np.asarray(mesh.maxLevelCell[cells])
+            bottomDepth = np.asarray(mesh.bottomDepth[cells])
+            latCell = np.asarray(mesh.latCell[cells])
+            mask = np.arange(nVertLevels)[np.newaxis, :] < maxLevelCell[:, np.newaxis]
+
+            ssh = 0.5 * np.sin(2.0 * latCell) + 0.05 * rng.standard_normal(n)
+            # sea ice loading in polar cells
+            ice = np.where(np.abs(latCell) > np.radians(65.0), rng.uniform(0.0, 1.0, n), 0.0)
+
+            # z-star: the resting thicknesses, partial bottom cell, stretched by ssh
+            h = np.tile(refThickness, (n, 1))
+            last = maxLevelCell - 1
+            h[np.arange(n), last] = bottomDepth - np.where(last > 0, refBottomDepth[last - 1], 0.0)
+            h = np.where(mask, h, 0.0)
+            h *= ((bottomDepth + ssh) / bottomDepth)[:, np.newaxis]
+            h *= 1.0 + 1.0e-3 * rng.standard_normal((n, nVertLevels))
+
+            decay = np.exp(-refMid / 1000.0)[np.newaxis, :]
+            temp = 2.0 + (20.0 * np.cos(latCell)[:, np.newaxis] + warming) * decay \
+                + 0.1 * rng.standard_normal((n, nVertLevels))
+            salt = 34.7 - 0.5 * decay + 0.01 * rng.standard_normal((n, nVertLevels))
+            rho = 1027.8 - 0.2 * (temp - 2.0) + 0.8 * (salt - 34.7) + 4.5e-3 * refMid[np.newaxis, :]
+
+            fields = {'density': rho, 'layerThickness': h,
+                      'activeTracers_temperature': temp, 'activeTracers_salinity': salt}
+            for name in names:
+                var3d[name][0, cells, :] = np.where(mask, fields[name], fillValue)
+            var2d['ssh'][0, cells] = ssh
+            var2d['pressureAdjustedSSH'][0, cells] = ssh + ice
+    finally:
+        f.close()
+    return filename
+
+
+def write_run(path, mesh, yrs, mos=range(1, 13), warmingRate=0.01, seed=0, tracers=False):
+    '''
+    Write monthly files named like the model's (monthlyTemplate) in path for
+    the given years and months, warming by warmingRate degC per year.
+    Returns the list of (yr, mo, filename), as from monthly_files().
+    '''
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    files = []
+    for n, (yr, mo) in enumerate((yr, mo) for yr in yrs for mo in mos):
+        filename = os.path.join(path, monthlyTemplate.format(yr=yr, mo=mo))
+        write_output(filename, mesh, seed=seed + n, warming=warmingRate * (yr - yrs[0] + (mo - 0.5) / 12.0),
+                     tracers=tracers)
+        files.append((yr, mo, filename))
+    return files
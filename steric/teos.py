@@ -0,0 +1,112 @@
+'''
+Thermosteric / halosteric decomposition of a steric change with TEOS-10.
+
+The model density only gives the total steric change.  Here density is
+recomputed from temperature and salinity with gsw for the two periods, and
+again with either one held at the reference (first period) values:
+
+  total     = -1/rho_ref * sum( (rho(S2, T2) - rho(S1, T1)) * h1 )
+  thermo    = -1/rho_ref * sum( (rho(S1, T2) - rho(S1, T1)) * h1 )
+  halo      = -1/rho_ref * sum( (rho(S2, T1) - rho(S1, T1)) * h1 )
+  nonlinear = total - thermo - halo
+
+with layer thickness and pressure held at the reference period.  The
+equation of state is evaluated on the active (cell, level) points of a whole
+block of cells at once as contiguous 1D arrays, not column by column.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+from .column import cell_blocks, read_var
+from .profiling import profiler
+
+tempVar = 'timeMonthly_avg_activeTracers_temperature'
+saltVar = 'timeMonthly_avg_activeTracers_salinity'
+thicknessVar = 'timeMonthly_avg_layerThickness'
+
+decompositionFields = ('total', 'thermo', 'halo', 'nonlinear')
+
+
+def _read_block(file, cells, mask):
+    '''Active points of temperature, salinity and thickness for a block of cells.'''
+    with profiler.stage('read'):
+        temp = read_var(file.variables[tempVar], (0, cells, slice(None)))
+        salt = read_var(file.variables[saltVar], (0, cells, slice(None)))
+        h = read_var(file.variables[thicknessVar], (0, cells, slice(None)))
+    for x in (temp, salt, h):
+        if np.ma.isMaskedArray(x):
+            mask = mask & ~np.ma.getmaskarray(x)
+    return (np.ma.getdata(temp)[mask], np.ma.getdata(salt)[mask], np.ma.getdata(h)[mask],
+            np.ma.getdata(h) * mask, mask)
+
+
+def _absolute_salinity(gsw, SP, p, lon, lat):
+    '''
+    SA from practical salinity.  The gsw atlas has no data at some locations
+    (e.g. under ice shelves), and there the reference salinity is used.
+    '''
+    SA = gsw.SA_from_SP(SP, p, lon, lat)
+    missing = np.isnan(SA)
+    if missing.any():
+        SA[missing] = gsw.SR_from_SP(SP[missing])
+    return SA
+
+
+def steric_decomposition(file1, file2, mesh, rho_ref, chunkSize=None):
+    '''
+    Split the steric change from file1 (reference period) to file2 into
+    thermosteric and halosteric parts.  file1 and file2 are open netCDF4
+    Datasets with temperature and salinity output.
+
+    Returns a dict of (nCells,) arrays in m: 'total', 'thermo', 'halo' and
+    'nonlinear'.
+    '''
+    import gsw
+
+    nCells = mesh.nCells
+    levelMask = mesh.levelMask
+    bottomDepth = np.ma.getdata(mesh.bottomDepth)
+    latDeg = np.degrees(mesh.latCell)
+    lonDeg = np.degrees(mesh.lonCell)
+
+    out = dict((field, np.zeros((nCells,))) for field in decompositionFields)
+    for cells in cell_blocks(nCells, chunkSize):
+        mask = levelMask[cells]
+        temp1, salt1, h1, hFull, mask1 = _read_block(file1, cells, mask)
+        temp2, salt2, _, _, mask2 = _read_block(file2, cells, mask)
+        if not np.array_equal(mask1, mask2):
+            # keep only points that are valid in both periods
+            both = mask1 & mask2
+            temp1, salt1, h1 = temp1[both[mask1]], salt1[both[mask1]], h1[both[mask1]]
+            temp2, salt2 = temp2[both[mask2]], salt2[both[mask2]]
+            hFull = hFull * both
+            mask1 = both
+
+        with profiler.stage('integrate'):
+            # pressure at layer mid-depths of the reference period
+            zSurf = hFull.sum(axis=1) - bottomDepth[cells]
+            zMid = zSurf[:, np.newaxis] - hFull.cumsum(axis=1) + 0.5 * hFull
+            cellOf = np.nonzero(mask1)[0]
+            lat = latDeg[cells][cellOf]
+            lon = lonDeg[cells][cellOf]
+            p = gsw.p_from_z(np.minimum(zMid[mask1], 0.0), lat)
+
+            # MPAS carries potential temperature and practical salinity
+            SA1 = _absolute_salinity(gsw, salt1, p, lon, lat)
+            SA2 = _absolute_salinity(gsw, salt2, p, lon, lat)
+            CT1 = gsw.CT_from_pt(SA1, temp1)
+            CT2 = gsw.CT_from_pt(SA2, temp2)
+
+            rho11 = gsw.rho(SA1, CT1, p)
+            nBlock = mask1.shape[0]
+
+            def column(rho):
+                return -1.0 / rho_ref * np.bincount(cellOf, weights=(rho - rho11) * h1, minlength=nBlock)
+
+            out['total'][cells] = column(gsw.rho(SA2, CT2, p))
+            out['thermo'][cells] = column(gsw.rho(SA1, CT2, p))
+            out['halo'][cells] = column(gsw.rho(SA2, CT1, p))
+    out['nonlinear'] = out['total'] - out['thermo'] - out['halo']
+    return out
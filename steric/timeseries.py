@@ -0,0 +1,174 @@
+'''
+Steric sea level time series from the monthly timeSeriesStatsMonthly files
+of a run, computed in parallel worker processes.
+
+This replaces averaging the monthly output into decade files with NCO before
+running the steric calculation.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import glob
+import os
+import re
+import multiprocessing
+from collections import deque
+
+import numpy as np
+import netCDF4
+
+from .column import level_mask, file_steric
+from .profiling import profiler
+
+monthlyTemplate = 'mpaso.hist.am.timeSeriesStatsMonthly.{yr:04d}-{mo:02d}-01.nc'
+_monthlyRegex = re.compile(r'timeSeriesStatsMonthly\.(\d+)-(\d+)-(\d+)\.nc$')
+
+stericFields = ('SL', 'SLv', 'ht')
+
+
+def monthly_files(path, yrs=None, mos=None):
+    '''
+    Return a list of (yr, mo, filename) for the monthly files in path, sorted
+    in time.  yrs and mos optionally restrict which years and months are used.
+    '''
+    files = []
+    for filename in glob.glob(os.path.join(path, '*timeSeriesStatsMonthly.*.nc')):
+        match = _monthlyRegex.search(os.path.basename(filename))
+        if match is None:
+            continue
+        yr, mo = int(match.group(1)), int(match.group(2))
+        if yrs is not None and yr not in yrs:
+            continue
+        if mos is not None and mo not in mos:
+            continue
+        files.append((yr, mo, filename))
+    return sorted(files)
+
+
+def decimal_year(yr, mo):
+    '''Mid-month time in years, e.g. (1900, 1) -> 1900.0417.'''
+    return yr + (mo - 0.5) / 12.0
+
+
+# Mesh fields and settings for the worker processes.  These are sent once per
+# worker by the pool initializer rather than with every file.
+_worker = {}
+
+
+def _init_worker(maxLevelCell, bottomDepth, nVertLevels, rho_ref, iceCorrection, chunkSize, cutoffs=None):
+    _worker['maxLevelCell'] = maxLevelCell
+    _worker['bottomDepth'] = bottomDepth
+    _worker['mask'] = level_mask(maxLevelCell, nVertLevels)
+    _worker['rho_ref'] = rho_ref
+    _worker['iceCorrection'] = iceCorrection
+    _worker['chunkSize'] = chunkSize
+    _worker['cutoffs'] = cutoffs
+    # one work buffer per process, reused for every file it handles
+    _worker['work'] = np.empty((min(chunkSize or len(maxLevelCell), len(maxLevelCell)), nVertLevels))
+
+
+def _file_steric_worker(filename):
+    # stages timed here are sent back with the result and merged by the parent
+    profiler.reset()
+    f = netCDF4.Dataset(filename, 'r')
+    try:
+        result = file_steric(f, _worker['maxLevelCell'], _worker['bottomDepth'], _worker['rho_ref'],
+                             mask=_worker['mask'], iceCorrection=_worker['iceCorrection'],
+                             chunkSize=_worker['chunkSize'], cutoffs=_worker['cutoffs'],
+                             work=_worker['work'])
+    finally:
+        f.close()
+    return result, profiler.stages if profiler.enabled else None
+
+
+def map_steric(filenames, maxLevelCell, bottomDepth, rho_ref, nProcs=None, iceCorrection='pressure',
+               chunkSize=None, cutoffs=None):
+    '''
+    Generator yielding (SL, SLv, ht) for each file in filenames, in order,
+    computed by a pool of nProcs worker processes (default: all cores).
+    With cutoffs, each result also has the depth-limited SLz (see file_steric()).
+    At most 2 * nProcs files are submitted ahead of the one being yielded, so
+    a long list of files can be reduced without holding all the results in
+    memory.
+    '''
+    if len(filenames) == 0:
+        raise ValueError('No files to process')
+    maxLevelCell = np.ma.getdata(maxLevelCell)
+    bottomDepth = np.ma.getdata(bottomDepth)
+
+    f = netCDF4.Dataset(filenames[0], 'r')
+    nVertLevels = len(f.dimensions['nVertLevels'])
+    f.close()
+
+    nProcs = nProcs or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(nProcs, initializer=_init_worker,
+                                initargs=(maxLevelCell, bottomDepth, nVertLevels, rho_ref,
+                                          iceCorrection, chunkSize, cutoffs))
+    try:
+        # pool.imap() would submit every file at once and keep any results
+        # that finish early, so submit a few at a time instead
+        pending = deque()
+        remaining = iter(filenames)
+        for filename in remaining:
+            pending.append(pool.apply_async(_file_steric_worker, (filename,)))
+            if len(pending) == 2 * nProcs:
+                break
+        while pending:
+            result, stages = pending.popleft().get()
+            for filename in remaining:
+                pending.append(pool.apply_async(_file_steric_worker, (filename,)))
+                break
+            if stages is not None:
+                profiler.merge(stages)
+            yield result
+    finally:
+        # all results have been consumed by now unless something failed
+        pool.terminate()
+        pool.join()
+
+
+def iter_steric(files, maxLevelCell, bottomDepth, rho_ref, nProcs=None, iceCorrection='pressure',
+                chunkSize=None):
+    '''
+    Generator yielding (time, (SL, SLv, ht)) for each of files (as returned by
+    monthly_files()) in time order; see map_steric().
+    '''
+    if len(files) == 0:
+        raise ValueError('No monthly files to process')
+    results = map_steric([filename for _, _, filename in files], maxLevelCell, bottomDepth, rho_ref,
+                         nProcs=nProcs, iceCorrection=iceCorrection, chunkSize=chunkSize)
+    for (yr, mo, _), result in zip(files, results):
+        yield decimal_year(yr, mo), result
+
+
+def steric_timeseries(files, maxLevelCell, bottomDepth, areaCell, rho_ref, nProcs=None,
+                      fields=stericFields, iceCorrection='pressure', chunkSize=None):
+    '''
+    Compute SL, SLv and ht for every file in files (as returned by
+    monthly_files()) using a pool of nProcs worker processes (default: all
+    cores).
+
+    Returns a dict with 'time' (decimal years), a (nTimes, nCells) array for
+    each requested field and the area-weighted global mean of each field as
+    '<field>_mean'.  Only the fields listed in fields are kept, since the full
+    per-cell series of a long run is large (nTimes * nCells * 8 bytes each).
+    '''
+    areaCell = np.ma.getdata(areaCell)
+    nCells = len(maxLevelCell)
+    nTimes = len(files)
+
+    out = {'time': np.zeros((nTimes,))}
+    for field in fields:
+        out[field] = np.zeros((nTimes, nCells))
+        out[field + '_mean'] = np.zeros((nTimes,))
+    areaTotal = areaCell.sum()
+
+    for t, (time, result) in enumerate(iter_steric(files, maxLevelCell, bottomDepth, rho_ref, nProcs=nProcs,
+                                                   iceCorrection=iceCorrection, chunkSize=chunkSize)):
+        out['time'][t] = time
+        for field, values in zip(stericFields, result):
+            if field in fields:
+                out[field][t, :] = values
+                with profiler.stage('reduce'):
+                    out[field + '_mean'][t] = (values * areaCell).sum() / areaTotal
+    return out
@@ -0,0 +1,133 @@
+'''
+Time-window means of steric fields from a single pass over the monthly files.
+
+The drift and historical inputs used to be decade means made offline with
+NCO (mpaso.hist.0400-0410.nc, mpaso.hist.1900-1909.nc, ...), so every new
+period meant another pass over the raw monthly 3D output.  WindowMeans keeps
+running per-cell sums instead:
+  fixed windows   : (yrStart, yrEnd) ranges of years, inclusive, e.g.
+                    (1900, 1909) or (1993, 2007) to match Griffies et al. (2014);
+                    each month is added to the windows that contain it
+  sliding window  : the mean of the last slidingMonths months, updated by adding
+                    the new month and subtracting the one that drops out
+Either way a new month costs O(1) per cell, and any comparison between
+periods comes from the sums without rereading the 3D fields.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .timeseries import iter_steric, stericFields
+
+
+def annual_windows(yrStart, yrEnd):
+    '''(yr, yr) windows for every year from yrStart to yrEnd.'''
+    return [(yr, yr) for yr in range(yrStart, yrEnd + 1)]
+
+
+def decadal_windows(yrStart, yrEnd, length=10):
+    '''Consecutive windows of length years from yrStart, e.g. (1900, 1909), (1910, 1919), ...'''
+    return [(yr, yr + length - 1) for yr in range(yrStart, yrEnd + 1 - length + 1, length)]
+
+
+class WindowMeans(object):
+    '''
+    Running sums of fields (from stericFields) for nCells cells over fixed
+    windows and, optionally, a sliding window of slidingMonths months.
+    '''
+
+    def __init__(self, nCells, windows=(), slidingMonths=None, fields=('SL',)):
+        self.nCells = nCells
+        self.fields = tuple(fields)
+        self.windows = [tuple(window) for window in windows]
+        self.sums = dict(((field, window), np.zeros((nCells,))) for field in self.fields for window in self.windows)
+        self.counts = OrderedDict((window, 0) for window in self.windows)
+        self.slidingMonths = slidingMonths
+        if slidingMonths is not None:
+            # ring buffer of the months in the sliding window
+            self._ring = dict((field, np.zeros((slidingMonths, nCells))) for field in self.fields)
+            self._slidingSums = dict((field, np.zeros((nCells,))) for field in self.fields)
+        self.nMonths = 0
+        self.lastTime = None
+
+    def add(self, yr, mo, result):
+        '''
+        Add one month.  result is a dict of field -> (nCells,), or a tuple in
+        the order of stericFields as returned by file_steric().
+        '''
+        if not isinstance(result, dict):
+            result = dict(zip(stericFields, result))
+        for window in self.windows:
+            if window[0] <= yr <= window[1]:
+                for field in self.fields:
+                    self.sums[(field, window)] += np.ma.getdata(result[field])
+                self.counts[window] += 1
+        if self.slidingMonths is not None:
+            slot = self.nMonths % self.slidingMonths
+            for field in self.fields:
+                values = np.ma.getdata(result[field])
+                self._slidingSums[field] += values - self._ring[field][slot]
+                self._ring[field][slot] = values
+                if slot == 0 and self.nMonths > 0 and self.nMonths % (100 * self.slidingMonths) == 0:
+                    # now and then start again from the ring so round-off cannot build up
+                    self._slidingSums[field] = self._ring[field].sum(axis=0)
+        self.nMonths += 1
+        self.lastTime = (yr, mo)
+
+    def complete(self, window):
+        '''True once every month of a fixed window has been added.'''
+        return self.counts[tuple(window)] == 12 * (window[1] - window[0] + 1)
+
+    def mean(self, window, field='SL'):
+        '''Per-cell mean of field over a fixed window.'''
+        window = tuple(window)
+        if self.counts[window] == 0:
+            raise ValueError('No months in window {}-{}'.format(*window))
+        return self.sums[(field, window)] / self.counts[window]
+
+    def diff(self, window2, window1, field='SL'):
+        '''Mean of field over window2 minus that over window1.'''
+        return self.mean(window2, field) - self.mean(window1, field)
+
+    def rate(self, window2, window1, field='SL'):
+        '''diff() per year between the window centres, like SLCrate in the scripts.'''
+        years = 0.5 * (window2[0] + window2[1]) - 0.5 * (window1[0] + window1[1])
+        return self.diff(window2, window1, field) / years
+
+    def sliding_mean(self, field='SL'):
+        '''Per-cell mean over the last slidingMonths months (fewer at the start).'''
+        return self._slidingSums[field] / min(self.nMonths, self.slidingMonths)
+
+
+def stream_windows(files, maxLevelCell, bottomDepth, rho_ref, windows=(), slidingMonths=None, fields=('SL',),
+                   nProcs=None, iceCorrection='pressure', chunkSize=None):
+    '''
+    Generator reading each monthly file (as from monthly_files()) once, in
+    parallel, and yielding (yr, mo, WindowMeans) after every month, e.g. to
+    take sliding_mean() as it goes.  The same WindowMeans is yielded each
+    time.
+    '''
+    agg = WindowMeans(len(maxLevelCell), windows, slidingMonths, fields)
+    results = iter_steric(files, maxLevelCell, bottomDepth, rho_ref, nProcs=nProcs,
+                          iceCorrection=iceCorrection, chunkSize=chunkSize)
+    for (yr, mo, _), (_, result) in zip(files, results):
+        agg.add(yr, mo, result)
+        yield yr, mo, agg
+
+
+def window_means(files, maxLevelCell, bottomDepth, rho_ref, windows, fields=('SL',), nProcs=None,
+                 iceCorrection='pressure', chunkSize=None):
+    '''
+    WindowMeans of the fixed windows after one pass over the files, skipping
+    the files outside every window.
+    '''
+    files = [(yr, mo, filename) for yr, mo, filename in files
+             if any(window[0] <= yr <= window[1] for window in windows)]
+    agg = None
+    for _, _, agg in stream_windows(files, maxLevelCell, bottomDepth, rho_ref, windows, fields=fields,
+                                    nProcs=nProcs, iceCorrection=iceCorrection, chunkSize=chunkSize):
+        pass
+    return agg
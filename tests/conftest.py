@@ -0,0 +1,20 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import pytest
+
+from steric.mesh import Mesh
+from steric.synthetic import write_mesh, write_run
+
+
+@pytest.fixture(scope='session')
+def mesh(tmp_path_factory):
+    '''A small synthetic mesh, with no on-disk cache.'''
+    path = tmp_path_factory.mktemp('mesh')
+    return Mesh(write_mesh(str(path / 'mesh.nc'), 400, 12, seed=1), cacheDir=False)
+
+
+@pytest.fixture(scope='session')
+def run(mesh, tmp_path_factory):
+    '''24 monthly files, 1909-1910, as (yr, mo, filename) from monthly_files().'''
+    path = tmp_path_factory.mktemp('run')
+    return write_run(str(path), mesh, [1909, 1910], warmingRate=0.5, seed=3)
@@ -0,0 +1,116 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+
+import numpy as np
+import netCDF4
+import pytest
+
+from steric import cache as cacheModule
+from steric.cache import ResultCache
+from steric.column import file_steric
+
+
+def _counting(original, calls, name):
+    def counting(*args, **kwargs):
+        calls.append(name)
+        return original(*args, **kwargs)
+    return counting
+
+
+@pytest.fixture
+def computed(monkeypatch):
+    '''List that gets an entry every time the cache computes rather than loads.'''
+    calls = []
+    for name in ('file_steric', 'file_steric_cells'):
+        monkeypatch.setattr(cacheModule, name, _counting(getattr(cacheModule, name), calls, name))
+    return calls
+
+
+@pytest.fixture
+def filename(run, tmp_path):
+    '''A private copy of a monthly file, so its mtime can be changed.'''
+    copy = str(tmp_path / os.path.basename(run[0][2]))
+    shutil.copy(run[0][2], copy)
+    return copy
+
+
+def _full(mesh, filename, rho_ref=1036.0):
+    with netCDF4.Dataset(filename) as f:
+        return file_steric(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref)
+
+
+def test_hit_and_invalidation(mesh, filename, tmp_path, computed):
+    rc = ResultCache(str(tmp_path / 'cache'))
+    first = rc.file_steric(filename, mesh, 1036.0)
+    again = rc.file_steric(filename, mesh, 1036.0, chunkSize=50)
+    assert computed == ['file_steric']
+    for values, expected, ref in zip(again, first, _full(mesh, filename)):
+        np.testing.assert_array_equal(values, expected)
+        np.testing.assert_array_equal(values, ref)
+
+    # other settings are other entries
+    rc.file_steric(filename, mesh, 1026.0)
+    rc.file_steric(filename, mesh, 1036.0, iceCorrection='thickness')
+    rc.file_steric(filename, mesh, 1036.0, cutoffs=(700.0,))
+    assert len(computed) == 4
+
+    # a rewritten input file (new mtime) is not taken from the cache
+    st = os.stat(filename)
+    os.utime(filename, (st.st_atime, st.st_mtime + 10.0))
+    rc.file_steric(filename, mesh, 1036.0)
+    assert len(computed) == 5
+
+
+def test_cells(mesh, filename, tmp_path, computed):
+    rc = ResultCache(str(tmp_path / 'cache'))
+    full = _full(mesh, filename)
+    cells = np.array([5, 3, 200, 201, 399])
+    for _ in range(2):
+        result = rc.file_steric(filename, mesh, 1036.0, cells=cells)
+        for values, expected in zip(result, full):
+            np.testing.assert_array_equal(values, expected[cells])
+    assert computed == ['file_steric_cells']
+    rc.file_steric(filename, mesh, 1036.0, cells=cells[:-1])
+    assert computed == ['file_steric_cells'] * 2
+
+    # every cell, in any order, shares the entry of the full calculation
+    order = np.random.RandomState(0).permutation(mesh.nCells)
+    result = rc.file_steric(filename, mesh, 1036.0, cells=order)
+    rc.file_steric(filename, mesh, 1036.0)
+    assert computed == ['file_steric_cells'] * 2 + ['file_steric']
+    for values, expected in zip(result, full):
+        np.testing.assert_array_equal(values, expected[order])
+
+
+def test_lru_eviction(tmp_path):
+    entry = {'x': np.zeros(1000)}
+    rc = ResultCache(str(tmp_path / 'cache'), maxBytes=10**9)
+    for key in ('a', 'b', 'c'):
+        rc.put(key, entry)
+    size = os.path.getsize(rc._path('a'))
+    for n, key in enumerate(('a', 'b', 'c')):
+        os.utime(rc._path(key), (1000.0 + n, 1000.0 + n))
+    # using 'a' makes 'b' the least recently used
+    assert rc.get('a') is not None
+    rc.maxBytes = 3 * size
+    rc.put('d', entry)
+    assert [rc.get(key) is not None for key in ('a', 'b', 'c', 'd')] == [True, False, True, True]
+
+
+def test_get_survives_concurrent_eviction(tmp_path, monkeypatch):
+    rc = ResultCache(str(tmp_path / 'cache'))
+    rc.put('a', {'x': np.arange(3.0)})
+
+    def evicted(path, times):
+        raise OSError('gone')
+    monkeypatch.setattr(cacheModule.os, 'utime', evicted)
+    np.testing.assert_array_equal(rc.get('a')['x'], np.arange(3.0))
+
+
+def test_disabled(mesh, filename, computed):
+    rc = ResultCache(False)
+    rc.file_steric(filename, mesh, 1036.0)
+    rc.file_steric(filename, mesh, 1036.0)
+    assert len(computed) == 2
@@ -0,0 +1,137 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import netCDF4
+import pytest
+
+from steric import column
+from steric.column import file_steric, file_steric_cells, file_depth_steric, cell_ranges
+
+rho_ref = 1036.0
+
+
+def _loop_steric(f, maxLevelCell, bottomDepth, iceCorrection):
+    '''The per-cell loop of the original scripts (SL from steric-test or the G-cases, SLv and ht from the G-cases).'''
+    rho = f.variables['timeMonthly_avg_density'][0, :, :]
+    layerThickness = f.variables['timeMonthly_avg_layerThickness'][0, :, :]
+    ssh = f.variables['timeMonthly_avg_ssh'][0, :]
+    pressAdjSSH = f.variables['timeMonthly_avg_pressureAdjustedSSH'][0, :]
+    nCells = len(maxLevelCell)
+    SL = np.zeros((nCells,))
+    SLv = np.zeros((nCells,))
+    ht = np.zeros((nCells,))
+    for i in range(nCells):
+        maxLev = maxLevelCell[i]
+        SL[i] = -1.0 / rho_ref * (rho[i, :maxLev] * layerThickness[i, :maxLev]).sum() + bottomDepth[i]
+        SLv[i] = (rho_ref / rho[i, :maxLev] * layerThickness[i, :maxLev]).sum() - bottomDepth[i]
+        ht[i] = layerThickness[i, :maxLev].sum() - bottomDepth[i]
+        if iceCorrection == 'thickness':
+            SL[i] = SL[i] + (pressAdjSSH[i] - ssh[i]) * 1035.0 / 1026.0
+        else:
+            SL[i] = SL[i] - 1.0 / rho_ref * (pressAdjSSH[i] - ssh[i]) * 1026.0
+        SLv[i] = SLv[i] + (pressAdjSSH[i] - ssh[i]) * 1035.0 / 1026.0 * rho_ref / rho[i, 0]
+        ht[i] = ht[i] + (pressAdjSSH[i] - ssh[i]) * 1035.0 / 1026.0
+    return SL, SLv, ht
+
+
+def _loop_depth_steric(f, maxLevelCell, bottomDepth, cutoff):
+    '''-1/rho_ref * integral(rho dz) above cutoff, a layer at a time.'''
+    rho = f.variables['timeMonthly_avg_density'][0, :, :]
+    layerThickness = f.variables['timeMonthly_avg_layerThickness'][0, :, :]
+    SLz = np.zeros((len(maxLevelCell),))
+    for i in range(len(maxLevelCell)):
+        maxLev = maxLevelCell[i]
+        zTop = layerThickness[i, :maxLev].sum() - bottomDepth[i]
+        for k in range(maxLev):
+            zBot = zTop - layerThickness[i, k]
+            dz = layerThickness[i, k] if cutoff is None else max(0.0, zTop - max(zBot, -cutoff))
+            SLz[i] += -1.0 / rho_ref * rho[i, k] * dz
+            zTop = zBot
+    return SLz
+
+
+@pytest.fixture
+def f(run):
+    with netCDF4.Dataset(run[0][2]) as f:
+        yield f
+
+
+@pytest.mark.parametrize('iceCorrection', ['pressure', 'thickness'])
+def test_file_steric_matches_loop(mesh, f, iceCorrection):
+    maxLevelCell = np.asarray(mesh.maxLevelCell)
+    bottomDepth = np.asarray(mesh.bottomDepth)
+    # the synthetic files have fill values below maxLevelCell, which must not count
+    assert np.ma.getmaskarray(f.variables['timeMonthly_avg_density'][0, :, :]).any()
+    result = file_steric(f, maxLevelCell, bottomDepth, rho_ref, iceCorrection=iceCorrection)
+    for values, expected in zip(result, _loop_steric(f, maxLevelCell, bottomDepth, iceCorrection)):
+        np.testing.assert_allclose(values, expected, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('chunkSize', [1, 7, 100, 399, 10000])
+def test_chunked_is_identical(mesh, f, chunkSize):
+    cutoffs = (100.0, 700.0, None)
+    full = file_steric(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, cutoffs=cutoffs)
+    chunked = file_steric(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, cutoffs=cutoffs, chunkSize=chunkSize)
+    for values, expected in zip(chunked, full):
+        np.testing.assert_array_equal(values, expected)
+    np.testing.assert_array_equal(
+        file_depth_steric(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, cutoffs, chunkSize=chunkSize), full[3])
+
+
+def test_depth_steric_matches_loop(mesh, f):
+    maxLevelCell = np.asarray(mesh.maxLevelCell)
+    bottomDepth = np.asarray(mesh.bottomDepth)
+    cutoffs = (0.0, 5.0, 100.0, 700.0, 2000.0, 1.0e5, None)
+    SLz = file_depth_steric(f, maxLevelCell, bottomDepth, rho_ref, cutoffs)
+    for n, cutoff in enumerate(cutoffs):
+        np.testing.assert_allclose(SLz[n], _loop_depth_steric(f, maxLevelCell, bottomDepth, cutoff),
+                                   rtol=0, atol=1e-9)
+    # the full column is SL without the sea floor and sea ice terms
+    SL = file_steric(f, maxLevelCell, bottomDepth, rho_ref, iceCorrection=None)[0]
+    np.testing.assert_allclose(SLz[-1], SL - bottomDepth, rtol=0, atol=1e-9)
+
+
+def test_cell_ranges():
+    assert cell_ranges([]) == []
+    assert cell_ranges([5, 3, 4, 9, 10, 12], maxGap=0) == [slice(3, 6), slice(9, 11), slice(12, 13)]
+    assert cell_ranges([5, 3, 4, 9, 10, 12], maxGap=1) == [slice(3, 6), slice(9, 13)]
+    # by default, nearby ranges are merged and far apart ones kept
+    blocks = np.concatenate((np.arange(0, 5000, 2), np.arange(10**6, 10**6 + 5000)))
+    assert cell_ranges(blocks) == [slice(0, 4999), slice(10**6, 10**6 + 5000)]
+    # ...and cells scattered through the file are read as one slab
+    scattered = np.random.RandomState(0).choice(10**6, 30000, replace=False)
+    assert cell_ranges(scattered) == [slice(scattered.min(), scattered.max() + 1)]
+    assert len(cell_ranges(scattered, maxGap=0)) > 20000
+
+
+@pytest.mark.parametrize('maxGap, nReads', [(None, 1), (0, 3), (20, 2)])
+def test_file_steric_cells_reads(mesh, f, monkeypatch, maxGap, nReads):
+    '''One read per range: scattered cells must not turn into thousands of small reads.'''
+    reads = []
+    original = column.read_steric_vars
+
+    def counting(file, cells=slice(None), masked=True):
+        reads.append(cells)
+        return original(file, cells, masked)
+    monkeypatch.setattr(column, 'read_steric_vars', counting)
+    cells = np.array([10, 11, 12, 40, 41, 50])
+    file_steric_cells(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, cells, maxGap=maxGap)
+    assert len(reads) == nReads
+    assert sum(r.stop - r.start for r in reads) <= 41
+
+    del reads[:]
+    scattered = np.random.RandomState(1).choice(mesh.nCells, mesh.nCells // 3, replace=False)
+    file_steric_cells(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, scattered)
+    assert len(reads) == 1
+
+
+@pytest.mark.parametrize('maxGap', [0, 3])
+def test_file_steric_cells_matches_full(mesh, f, maxGap):
+    full = file_steric(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, cutoffs=(700.0,))
+    rng = np.random.RandomState(0)
+    for cells in (rng.permutation(mesh.nCells)[:57], np.arange(100, 180), np.arange(mesh.nCells),
+                  np.array([0, mesh.nCells - 1, 0])):
+        result = file_steric_cells(f, mesh.maxLevelCell, mesh.bottomDepth, rho_ref, cells, cutoffs=(700.0,),
+                                   chunkSize=16, maxGap=maxGap)
+        for values, expected in zip(result, full):
+            np.testing.assert_array_equal(values, expected[..., cells])
@@ -0,0 +1,79 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import netCDF4
+import pytest
+
+from steric.column import file_steric
+from steric.drift import DriftFit, fit_drift
+from steric.timeseries import decimal_year
+
+
+def _series(nTimes=40, nCells=50, seed=0):
+    rng = np.random.RandomState(seed)
+    t = 400.0 + np.arange(nTimes) / 12.0 + 1.0 / 24.0
+    c = rng.standard_normal((3, nCells))
+    y = c[0] + c[1] * (t[:, np.newaxis] - 400.0) + 0.1 * c[2] * (t[:, np.newaxis] - 400.0)**2 \
+        + 0.01 * rng.standard_normal((nTimes, nCells))
+    return t, y
+
+
+@pytest.mark.parametrize('order', [1, 2])
+def test_matches_polyfit(order):
+    t, y = _series()
+    fit = DriftFit(y.shape[1], order=order)
+    for n in range(len(t)):
+        fit.add(t[n], y[n])
+    expected = np.polyfit(t - t[0], y, order)[::-1]
+    np.testing.assert_allclose(fit.coefficients(), expected, rtol=0, atol=1e-9)
+    tMid = 0.5 * (t[0] + t[-1])
+    slope = expected[1] + 2.0 * expected[2] * (tMid - t[0]) if order == 2 else expected[1]
+    np.testing.assert_allclose(fit.rate(), slope, rtol=0, atol=1e-9)
+    if order == 2:
+        tLate = t[-1] + 5.0
+        np.testing.assert_allclose(fit.rate(tLate), expected[1] + 2.0 * expected[2] * (tLate - t[0]),
+                                   rtol=0, atol=1e-9)
+    np.testing.assert_allclose(fit.evaluate(t[3]), np.polyval(np.polyfit(t - t[0], y, order), t[3] - t[0]),
+                               rtol=0, atol=1e-9)
+
+
+def test_too_few_times():
+    fit = DriftFit(3, order=2)
+    fit.add(0.0, np.zeros(3))
+    fit.add(1.0, np.zeros(3))
+    with pytest.raises(ValueError):
+        fit.coefficients()
+
+
+@pytest.mark.parametrize('order', [1, 2])
+def test_save_load_and_extend(order, tmp_path):
+    t, y = _series()
+    full = DriftFit(y.shape[1], order=order)
+    part = DriftFit(y.shape[1], order=order)
+    for n in range(len(t)):
+        full.add(t[n], y[n])
+        if n < 25:
+            part.add(t[n], y[n])
+    filename = str(tmp_path / 'drift.nc')
+    part.save(filename, rho_ref=1036.0)
+    loaded = DriftFit.load(filename)
+    assert (loaded.order, loaded.t0, loaded.tMin, loaded.tMax) == (order, part.t0, part.tMin, part.tMax)
+    np.testing.assert_array_equal(loaded.coefficients(), part.coefficients())
+    with netCDF4.Dataset(filename) as f:
+        np.testing.assert_array_equal(f.variables['drift'][:], part.rate())
+        assert f.rho_ref == 1036.0
+    # extending the loaded fit gives the fit of the whole series
+    for n in range(25, len(t)):
+        loaded.add(t[n], y[n])
+    np.testing.assert_allclose(loaded.coefficients(), full.coefficients(), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(loaded.rate(), full.rate(), rtol=0, atol=1e-12)
+
+
+def test_fit_drift_files(mesh, run):
+    fit = fit_drift(run, mesh.maxLevelCell, mesh.bottomDepth, 1036.0, nProcs=2)
+    t = np.array([decimal_year(yr, mo) for yr, mo, _ in run])
+    SL = []
+    for _, _, filename in run:
+        with netCDF4.Dataset(filename) as f:
+            SL.append(file_steric(f, mesh.maxLevelCell, mesh.bottomDepth, 1036.0)[0])
+    np.testing.assert_allclose(fit.rate(), np.polyfit(t - t[0], np.array(SL), 1)[0], rtol=0, atol=1e-9)
@@ -0,0 +1,86 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import netCDF4
+import pytest
+
+from steric import incremental
+from steric.incremental import IncrementalSteric
+
+
+def _full(mesh, run, stateFile, **kwargs):
+    inc = IncrementalSteric(stateFile, mesh, 1036.0, nProcs=2, **kwargs)
+    inc.update(run)
+    return inc
+
+
+def _check_same(inc, ref):
+    series, refSeries = inc.series(), ref.series()
+    assert sorted(series) == sorted(refSeries)
+    for name in series:
+        np.testing.assert_array_equal(series[name], refSeries[name])
+    means, refMeans = inc.decadal_means(complete=False), ref.decadal_means(complete=False)
+    assert list(means) == list(refMeans)
+    for decade in means:
+        assert means[decade]['nMonths'] == refMeans[decade]['nMonths']
+        for field in inc.fields:
+            np.testing.assert_allclose(means[decade][field], refMeans[decade][field], rtol=0, atol=1e-12)
+
+
+def test_update_in_two_steps(mesh, run, tmp_path):
+    ref = _full(mesh, run, str(tmp_path / 'ref.nc'))
+    inc = IncrementalSteric(str(tmp_path / 'state.nc'), mesh, 1036.0, nProcs=2)
+    assert inc.update(run[:7]) == 7
+    assert inc.update(run) == len(run) - 7
+    assert inc.update(run) == 0
+    _check_same(inc, ref)
+
+
+@pytest.mark.parametrize('where', ['record', 'sums'])
+@pytest.mark.parametrize('nth', [4, 8])
+def test_interrupted_update(mesh, run, tmp_path, monkeypatch, where, nth):
+    '''An update stopped part way through a month (record or sums) is finished by the next one.'''
+    ref = _full(mesh, run, str(tmp_path / 'ref.nc'))
+    inc = IncrementalSteric(str(tmp_path / 'state.nc'), mesh, 1036.0, nProcs=2)
+    inc.update(run[:5])
+
+    # the nth new month is cut off: 1909-09, or 1910-01, the first of a new decade
+    calls = []
+    if where == 'record':
+        original = incremental.decimal_year
+
+        def stop(yr, mo):
+            calls.append((yr, mo))
+            if len(calls) == nth:
+                raise KeyboardInterrupt()
+            return original(yr, mo)
+        monkeypatch.setattr(incremental, 'decimal_year', stop)
+    else:
+        original = IncrementalSteric._add_to_sums
+
+        def stop(self, f, d, slot, count, values):
+            calls.append(d)
+            if len(calls) == nth:
+                # the new sums are written but the slot is not committed
+                f.variables[self.fields[0] + '_sum'][d, 1 - slot, :] = 1.0e30
+                raise KeyboardInterrupt()
+            return original(self, f, d, slot, count, values)
+        monkeypatch.setattr(IncrementalSteric, '_add_to_sums', stop)
+    with pytest.raises(KeyboardInterrupt):
+        inc.update(run[:20])
+    monkeypatch.undo()
+
+    assert len(inc.processed()) == 5 + nth - 1
+    assert inc.update(run) == len(run) - (5 + nth - 1)
+    _check_same(inc, ref)
+    with netCDF4.Dataset(inc.stateFile) as f:
+        assert len(f.dimensions['Time']) == len(run)
+
+
+def test_settings_are_checked(mesh, run, tmp_path):
+    stateFile = str(tmp_path / 'state.nc')
+    IncrementalSteric(stateFile, mesh, 1036.0, keepCells=False, nProcs=2).update(run[:2])
+    for kwargs in ({'keepCells': True}, {'keepCells': False, 'iceCorrection': 'thickness'},
+                   {'keepCells': False, 'fields': ('SL',)}):
+        with pytest.raises(ValueError):
+            IncrementalSteric(stateFile, mesh, 1036.0, **kwargs).update(run)
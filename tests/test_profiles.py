@@ -0,0 +1,53 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+
+import numpy as np
+import netCDF4
+import pytest
+
+from steric.column import file_depth_steric
+from steric.profiles import write_steric_profiles, read_steric_profile
+
+
+@pytest.fixture(scope='module')
+def profiles(mesh, run, tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('profiles') / 'profiles.nc')
+    return write_steric_profiles(filename, [run[0][2], run[1][2]], mesh, 1036.0)
+
+
+def test_sea_floor_is_full_column(mesh, run, profiles):
+    depths, profile = read_steric_profile(profiles, time=1)
+    with netCDF4.Dataset(run[1][2]) as f:
+        full = file_depth_steric(f, mesh.maxLevelCell, mesh.bottomDepth, 1036.0, (None,))[0]
+    bottom = np.ma.getdata(profile)[np.arange(mesh.nCells), np.asarray(mesh.maxLevelCell)]
+    np.testing.assert_allclose(bottom, full, rtol=0, atol=1e-9)
+
+
+def test_depth_range(mesh, profiles):
+    depths, profile = read_steric_profile(profiles, cells=np.array([3, 1, 7]), depthRange=(0.0, 1000.0))
+    assert depths.min() >= 0.0 and depths.max() <= 1000.0
+    assert profile.shape == (3, len(depths))
+    with pytest.raises(ValueError, match='span'):
+        read_steric_profile(profiles, depthRange=(7000.0, 8000.0))
+
+
+def test_many_files(mesh, run, tmp_path):
+    '''More input files than may be open at once.'''
+    resource = pytest.importorskip('resource')
+    if not os.path.isdir('/proc/self/fd'):
+        pytest.skip('needs /proc/self/fd to count open files')
+    files = [filename for _, _, filename in run]
+    # room for the output, the reference and a few more, but not for all 24 inputs at once
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (len(os.listdir('/proc/self/fd')) + 12, hard))
+    try:
+        filename = write_steric_profiles(str(tmp_path / 'many.nc'), files, mesh, 1036.0,
+                                         referenceFile=run[0][2], chunkSize=150)
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    depths, first = read_steric_profile(filename, time=0)
+    assert np.ma.getdata(first).shape == (mesh.nCells, mesh.nVertLevels + 1)
+    assert np.abs(np.ma.compressed(first)).max() == 0.0
+    depths, last = read_steric_profile(filename, time=len(run) - 1)
+    assert np.abs(np.ma.compressed(last)).max() > 0.0
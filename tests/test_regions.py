@@ -0,0 +1,35 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+from steric.mesh import Mesh
+from steric.regions import Regions
+
+
+def test_mean_matches_scripts(mesh):
+    # a Mesh of its own, since areaCell is changed below
+    mesh = Mesh(mesh.filename, cacheDir=False)
+    regions = Regions(mesh)
+    regions.add('empty', np.zeros(mesh.nCells, dtype=bool))
+    areaCell = np.asarray(mesh.areaCell)
+    # the synthetic cells all have the same area, so vary it to make the weighting count
+    areaCell = areaCell * np.random.RandomState(1).uniform(0.5, 1.5, mesh.nCells)
+    mesh._fields['areaCell'] = areaCell
+    field = np.random.RandomState(2).standard_normal((3, mesh.nCells))
+
+    means1d = regions.mean(field[0])
+    means2d = regions.mean(field)
+    assert means1d.shape == (len(regions.names),)
+    assert means2d.shape == (len(regions.names), 3)
+    for r, name in enumerate(regions.names):
+        idx = regions.cells(name)
+        if name == 'empty':
+            assert len(idx) == 0
+            assert np.isnan(means1d[r]) and np.isnan(means2d[r]).all()
+            continue
+        assert len(idx) > 0, name
+        # as the scripts do it: (x*areaCell).mean()/areaCell.mean() over idx
+        expected = [(x[idx] * areaCell[idx]).mean() / areaCell[idx].mean() for x in field]
+        np.testing.assert_allclose(means1d[r], expected[0], rtol=1e-12)
+        np.testing.assert_allclose(means2d[r], expected, rtol=1e-12)
+    assert list(regions.means(field[0])) == regions.names
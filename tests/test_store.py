@@ -0,0 +1,22 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import netCDF4
+
+from steric.regions import Regions
+from steric.store import ResultStore, mpas_xtime, regionTimeChunk
+
+
+def test_chunks_and_region_means(mesh, tmp_path):
+    filename = str(tmp_path / 'store.nc')
+    regions = Regions(mesh)
+    values = np.random.RandomState(0).rand(3, mesh.nCells)
+    with ResultStore(filename, mesh, regions) as store:
+        for n in range(3):
+            store.put('SL', values[n], xtime=mpas_xtime(1900, n + 1))
+    with netCDF4.Dataset(filename) as f:
+        # a map is one chunk, and so is a regional time series
+        assert f.variables['SL'].chunking() == [1, mesh.nCells]
+        assert f.variables['SL_regionMean'].chunking() == [regionTimeChunk, len(regions.names)]
+        np.testing.assert_array_equal(f.variables['SL'][:], values)
+        np.testing.assert_allclose(f.variables['SL_regionMean'][:], regions.mean(values).T, rtol=1e-14)
@@ -0,0 +1,19 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import netCDF4
+
+from steric.column import file_steric
+from steric.timeseries import map_steric
+
+
+def test_map_steric_in_order(mesh, run):
+    '''Results come back in file order, and as from file_steric(), with more files than are submitted at once.'''
+    filenames = [filename for _, _, filename in run]
+    results = list(map_steric(filenames, mesh.maxLevelCell, mesh.bottomDepth, 1036.0, nProcs=2))
+    assert len(results) == len(filenames)
+    for filename, result in zip(filenames, results):
+        with netCDF4.Dataset(filename) as f:
+            expected = file_steric(f, mesh.maxLevelCell, mesh.bottomDepth, 1036.0)
+        for values, ref in zip(result, expected):
+            np.testing.assert_array_equal(values, ref)
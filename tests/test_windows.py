@@ -0,0 +1,64 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import netCDF4
+import pytest
+
+from steric.column import file_steric
+from steric.timeseries import stericFields
+from steric.windows import WindowMeans, annual_windows, decadal_windows, stream_windows, window_means
+
+
+@pytest.fixture(scope='module')
+def direct(mesh, run):
+    '''(nMonths, nCells) of each field, one file at a time.'''
+    results = []
+    for _, _, filename in run:
+        with netCDF4.Dataset(filename) as f:
+            results.append(file_steric(f, mesh.maxLevelCell, mesh.bottomDepth, 1036.0))
+    return dict((field, np.array([result[k] for result in results])) for k, field in enumerate(stericFields))
+
+
+def test_window_helpers():
+    assert annual_windows(1900, 1902) == [(1900, 1900), (1901, 1901), (1902, 1902)]
+    assert decadal_windows(1900, 1929) == [(1900, 1909), (1910, 1919), (1920, 1929)]
+    assert decadal_windows(1900, 1928) == [(1900, 1909), (1910, 1919)]
+
+
+def test_fixed_windows(mesh, run, direct):
+    windows = [(1909, 1909), (1910, 1910), (1909, 1910), (1905, 1914)]
+    agg = window_means(run, mesh.maxLevelCell, mesh.bottomDepth, 1036.0, windows, fields=('SL', 'ht'), nProcs=2)
+    months = {(1909, 1909): slice(0, 12), (1910, 1910): slice(12, 24), (1909, 1910): slice(0, 24),
+              (1905, 1914): slice(0, 24)}
+    for window in windows:
+        for field in ('SL', 'ht'):
+            np.testing.assert_allclose(agg.mean(window, field), direct[field][months[window]].mean(axis=0),
+                                       rtol=0, atol=1e-10)
+    assert agg.complete((1909, 1909)) and agg.complete((1909, 1910))
+    assert not agg.complete((1905, 1914))
+    assert agg.counts[(1905, 1914)] == 24
+    expected = direct['SL'][12:].mean(axis=0) - direct['SL'][:12].mean(axis=0)
+    np.testing.assert_allclose(agg.diff((1910, 1910), (1909, 1909)), expected, rtol=0, atol=1e-10)
+    np.testing.assert_allclose(agg.rate((1910, 1910), (1909, 1909)), expected / 1.0, rtol=0, atol=1e-10)
+    with pytest.raises(ValueError):
+        WindowMeans(mesh.nCells, [(1800, 1809)]).mean((1800, 1809))
+
+
+def test_sliding_files(mesh, run, direct):
+    for n, (yr, mo, agg) in enumerate(stream_windows(run, mesh.maxLevelCell, mesh.bottomDepth, 1036.0,
+                                                     slidingMonths=5, nProcs=2)):
+        assert (yr, mo) == run[n][:2]
+        np.testing.assert_allclose(agg.sliding_mean(), direct['SL'][max(n - 4, 0):n + 1].mean(axis=0),
+                                   rtol=0, atol=1e-10)
+
+
+def test_sliding_resum():
+    '''The sliding sums stay right past the points where they are rebuilt from the ring.'''
+    rng = np.random.RandomState(0)
+    values = 1.0e3 + rng.standard_normal((450, 4))
+    agg = WindowMeans(4, slidingMonths=2)
+    for n in range(len(values)):
+        agg.add(1900 + n // 12, n % 12 + 1, {'SL': values[n]})
+        np.testing.assert_allclose(agg.sliding_mean(), values[max(n - 1, 0):n + 1].mean(axis=0),
+                                   rtol=1e-13, atol=0)
+    assert agg.lastTime == (1937, 6)